@@ -1,6 +1,40 @@
 from django.apps import AppConfig
+from django.contrib.admin import autodiscover
+from django.contrib.admin.apps import SimpleAdminConfig
+from django.contrib.admin.checks import check_admin_app, check_dependencies
+from django.core import checks
 
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+
+class LazyAdminConfig(SimpleAdminConfig):
+    """
+    The admin without autodiscovery at startup: the admin modules of every
+    app are imported when the URLconf loads (see divvywonga.urls) or when the
+    admin checks run, not by every worker and management command.
+    """
+
+    def ready(self):
+        checks.register(check_dependencies, checks.Tags.admin)
+        checks.register(check_discovered_admin_app, checks.Tags.admin)
+
+
+def check_discovered_admin_app(app_configs, **kwargs):
+    autodiscover()
+    return check_admin_app(app_configs, **kwargs)
+
+
+class LazyTinyMCEConfig(AppConfig):
+    """
+    django-tinymce has no models; its models module only defines HTMLField,
+    which pulls in the widgets and the admin. Skip it at startup and leave
+    it to be imported by whatever uses the field or the widgets.
+    """
+
+    name = "tinymce"
+
+    def import_models(self):
+        self.models = self.apps.all_models[self.label]
@@ -0,0 +1,52 @@
+from django.utils.module_loading import import_string
+from core.metrics import CACHE_REQUESTS
+
+_MISSING = object()
+
+
+class MeteredCache:
+    """
+    Cache backend counting the hits and misses of get() and get_many(), and
+    of their async variants, on another backend. OPTIONS gives that backend as BACKEND and the name used
+    in the metrics as ALIAS; everything else is passed through.
+    """
+
+    def __init__(self, location, params):
+        options = dict(params.get("OPTIONS", {}))
+        backend = import_string(options.pop("BACKEND"))
+        self._alias = options.pop("ALIAS", "default")
+        self._cache = backend(location, {**params, "OPTIONS": options})
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def _count(self, value, default):
+        hit = value is not _MISSING
+        CACHE_REQUESTS.inc(cache=self._alias, result="hit" if hit else "miss")
+        return value if hit else default
+
+    def _count_many(self, keys, values):
+        if values:
+            CACHE_REQUESTS.inc(len(values), cache=self._alias, result="hit")
+        if len(keys) > len(values):
+            CACHE_REQUESTS.inc(
+                len(keys) - len(values), cache=self._alias, result="miss"
+            )
+        return values
+
+    def get(self, key, default=None, version=None):
+        return self._count(self._cache.get(key, _MISSING, version), default)
+
+    async def aget(self, key, default=None, version=None):
+        return self._count(await self._cache.aget(key, _MISSING, version), default)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        return self._count_many(keys, self._cache.get_many(keys, version))
+
+    async def aget_many(self, keys, version=None):
+        keys = list(keys)
+        return self._count_many(keys, await self._cache.aget_many(keys, version))
@@ -0,0 +1,95 @@
+"""
+Import time profiling of process startup.
+
+profile_startup() sets up Django in a fresh interpreter under
+`python -X importtime` and returns the time spent importing each module, so
+startup cost can be attributed per module and per app and checked against
+the STARTUP_IMPORT_BUDGETS setting.
+"""
+
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+
+STARTUP_CODE = "import django; django.setup()"
+# Loading the URLconf, and resolving and reversing a URL with it, is what the
+# first request of a worker adds on top
+URLCONF_CODE = (
+    STARTUP_CODE
+    + "; from django.urls import resolve, reverse; resolve(reverse('index'))"
+)
+
+# Modules that are loaded on first use and must not be imported at startup
+LAZY_MODULES = {
+    "django.contrib.auth.admin",
+    "users.admin",
+    "tinymce.models",
+    "tinymce.widgets",
+    "tinymce.urls",
+    "tinymce.views",
+    "crispy_forms.helper",
+}
+
+
+def profile_startup(urls=False):
+    """Return {module: self import time in microseconds} for a fresh startup."""
+    env = dict(os.environ)
+    env.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            URLCONF_CODE if urls else STARTUP_CODE,
+        ],
+        cwd=settings.BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # Lines look like "import time:  <self us> | <cumulative us> | <indented name>"
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_time, _, module = line.removeprefix("import time:").split("|")
+        if self_time.strip().isdigit():
+            times[module.strip()] = int(self_time)
+    return times
+
+
+def owner(module):
+    """Label of the installed app a module belongs to, else its top-level package."""
+    best = None
+    for app_config in apps.get_app_configs():
+        in_app = module == app_config.name or module.startswith(app_config.name + ".")
+        if in_app and (best is None or len(app_config.name) > len(best.name)):
+            best = app_config
+    return best.label if best is not None else module.partition(".")[0]
+
+
+def times_by_owner(times):
+    """Sum module times per app or top-level package, largest first."""
+    totals = defaultdict(int)
+    for module, self_time in times.items():
+        totals[owner(module)] += self_time
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def over_budget(times):
+    """Return {name: (milliseconds, budget)} for every budget that is exceeded."""
+    totals = times_by_owner(times)
+    totals["total"] = sum(times.values())
+    exceeded = {}
+    for name, budget in settings.STARTUP_IMPORT_BUDGETS.items():
+        milliseconds = totals.get(name, 0) / 1000
+        if milliseconds > budget:
+            exceeded[name] = (milliseconds, budget)
+    return exceeded
@@ -0,0 +1,77 @@
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+# Pages copied per backup step; the source is unlocked between steps
+BACKUP_PAGES = 256
+
+
+class Command(BaseCommand):
+    help = (
+        "Back up the SQLite databases with SQLite's online backup API. Pages are "
+        "copied in small steps, so the app keeps writing while the backup runs."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("destination", help="Directory to write the backups to")
+        parser.add_argument(
+            "--database",
+            action="append",
+            dest="databases",
+            help="Database alias to back up (repeatable; default: all of them)",
+        )
+        parser.add_argument(
+            "--pages",
+            type=int,
+            default=BACKUP_PAGES,
+            help="Pages copied per step",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.01,
+            help="Seconds to pause between steps to let writers in",
+        )
+
+    def handle(self, *args, destination, databases, pages, sleep, **options):
+        self.verbosity = options["verbosity"]
+        aliases = databases or list(settings.DATABASES)
+        for alias in aliases:
+            if alias not in settings.DATABASES:
+                raise CommandError(f"Unknown database alias: {alias}")
+            if settings.DATABASES[alias]["ENGINE"] != "django.db.backends.sqlite3":
+                raise CommandError(f"Database {alias} is not an SQLite database.")
+
+        destination = Path(destination)
+        destination.mkdir(parents=True, exist_ok=True)
+        stamp = timezone.now().strftime("%Y%m%d-%H%M%S")
+
+        for alias in aliases:
+            source = Path(settings.DATABASES[alias]["NAME"])
+            target = destination / f"{source.stem}-{stamp}{source.suffix}"
+            self._backup(source, target, pages, sleep)
+            self.stdout.write(f"Backed up {alias} to {target}")
+
+    def _backup(self, source, target, pages, sleep):
+        # Written under a temporary name so a partial file is never mistaken
+        # for a complete backup
+        partial = target.with_name(target.name + ".partial")
+        partial.unlink(missing_ok=True)
+
+        def progress(status, remaining, total):
+            if self.verbosity > 1:
+                self.stdout.write(f"  {total - remaining}/{total} pages")
+
+        # as_uri() escapes characters such as "?" and "#" in the path
+        uri = source.resolve().as_uri() + "?mode=ro"
+        with (
+            closing(sqlite3.connect(uri, uri=True)) as src,
+            closing(sqlite3.connect(partial)) as dst,
+        ):
+            src.backup(dst, pages=pages, progress=progress, sleep=sleep)
+        partial.replace(target)
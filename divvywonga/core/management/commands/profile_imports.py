@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.importtime import LAZY_MODULES, over_budget, profile_startup, times_by_owner
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the time spent importing modules at process startup, per app "
+        "and per module, and optionally check it against STARTUP_IMPORT_BUDGETS."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--urls",
+            action="store_true",
+            help="Also load the URLconf, as the first request of a worker does",
+        )
+        parser.add_argument(
+            "--top", type=int, default=20, help="Number of apps and modules to list"
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Fail if a budget is exceeded or a lazy module is imported",
+        )
+
+    def handle(self, *args, urls, top, check, **options):
+        times = profile_startup(urls=urls)
+        total = sum(times.values())
+        self.stdout.write(f"{len(times)} modules imported in {total / 1000:.1f} ms\n")
+
+        self.stdout.write(f"Slowest {top} apps or packages:")
+        for name, self_time in list(times_by_owner(times).items())[:top]:
+            self.stdout.write(f"  {self_time / 1000:8.1f} ms  {name}")
+
+        self.stdout.write(f"\nSlowest {top} modules:")
+        slowest = sorted(times.items(), key=lambda item: item[1], reverse=True)
+        for module, self_time in slowest[:top]:
+            self.stdout.write(f"  {self_time / 1000:8.1f} ms  {module}")
+
+        if not check:
+            return
+
+        problems = [
+            f"{name} took {milliseconds:.1f} ms, over its {budget} ms budget"
+            for name, (milliseconds, budget) in over_budget(times).items()
+        ]
+        if not urls:
+            problems.extend(
+                f"{module} is imported at startup"
+                for module in sorted(LAZY_MODULES & times.keys())
+            )
+        if problems:
+            raise CommandError("\n".join(problems))
+        self.stdout.write(self.style.SUCCESS("\nWithin the startup import budgets."))
@@ -0,0 +1,344 @@
+"""
+Prometheus metrics shared by every worker process.
+
+Each process adds to its own memory-mapped files in METRICS_DIR, and the
+/metrics view sums the files of all processes, so the numbers cover every
+gunicorn worker. Counters of workers that have exited are folded into an
+archive file so they keep counting; their gauges are dropped.
+
+Values that are cheaper to compute when scraped (e.g. the length of a
+backlog in the database) come from the METRICS_COLLECTORS callables.
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+from functools import cache
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+INITIAL_FILE_SIZE = 64 * 1024
+HEADER = struct.Struct("Q")  # bytes of the file in use
+ARCHIVE_NAME = "counter_archive.db"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class MmapFile:
+    """
+    Append-only table of float values by key in a memory-mapped file.
+
+    Entries are <key length><key, padded to 8 bytes><double>. Only one process
+    writes a file; the used size in the header is updated after an entry is
+    complete, so other processes can read it at any time.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "a+b")  # noqa: SIM115 - stays open for the mmap
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(INITIAL_FILE_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._lock = threading.Lock()
+
+        self._used = HEADER.unpack_from(self._map)[0]
+        if self._used == 0:
+            self._used = HEADER.size
+            HEADER.pack_into(self._map, 0, self._used)
+        self._positions = {key: pos for key, _, pos in _entries(self._map)}
+
+    def add(self, key, amount):
+        with self._lock:
+            pos = self._positions.get(key) or self._append(key)
+            value = struct.unpack_from("d", self._map, pos)[0]
+            struct.pack_into("d", self._map, pos, value + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            pos = self._positions.get(key) or self._append(key)
+            struct.pack_into("d", self._map, pos, value)
+
+    def _append(self, key):
+        encoded = key.encode()
+        padding = b" " * (-(4 + len(encoded)) % 8)
+        entry = struct.pack(
+            f"i{len(encoded) + len(padding)}sd", len(encoded), encoded + padding, 0.0
+        )
+
+        if self._used + len(entry) > len(self._map):
+            size = len(self._map)
+            while self._used + len(entry) > size:
+                size *= 2
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+
+        self._map[self._used : self._used + len(entry)] = entry
+        self._used += len(entry)
+        HEADER.pack_into(self._map, 0, self._used)
+        self._positions[key] = self._used - 8
+        return self._used - 8
+
+
+def _entries(data):
+    """Yield (key, value, value position) for every entry in a metrics file."""
+    used = HEADER.unpack_from(data)[0]
+    pos = HEADER.size
+    while pos < used:
+        length = struct.unpack_from("i", data, pos)[0]
+        key = bytes(data[pos + 4 : pos + 4 + length]).decode()
+        pos += 4 + length + (-(4 + length) % 8)
+        yield key, struct.unpack_from("d", data, pos)[0], pos
+        pos += 8
+
+
+def read_file(path):
+    """Return {key: value} for a metrics file written by any process."""
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return {}
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return {key: value for key, value, _ in _entries(data)}
+
+
+class ProcessStore:
+    """The metrics files of the current process, reopened after a fork."""
+
+    def __init__(self):
+        self._pid = None
+        self._directory = None
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def file(self, kind):
+        pid = os.getpid()
+        directory = Path(settings.METRICS_DIR)
+        with self._lock:
+            # Tests point METRICS_DIR elsewhere
+            if pid != self._pid or directory != self._directory:
+                self._pid, self._directory, self._files = pid, directory, {}
+            if kind not in self._files:
+                directory.mkdir(parents=True, exist_ok=True)
+                path = directory / f"{kind}_{pid}.db"
+                if kind == "gauge":
+                    # Left behind by an exited process that had the same pid
+                    path.unlink(missing_ok=True)
+                self._files[kind] = MmapFile(path)
+            return self._files[kind]
+
+
+_store = ProcessStore()
+_registry = {}
+
+
+def _key(name, labels):
+    return json.dumps([name, labels], sort_keys=True)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry[name] = self
+
+    def _labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}")
+        return {name: str(value) for name, value in labels.items()}
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        _store.file("counter").add(_key(self.name, self._labels(labels)), amount)
+
+
+class Gauge(Metric):
+    """A gauge summed over the live processes."""
+
+    type = "gauge"
+
+    def inc(self, amount=1, **labels):
+        _store.file("gauge").add(_key(self.name, self._labels(labels)), amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        _store.file("gauge").set(_key(self.name, self._labels(labels)), value)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        counters = _store.file("counter")
+        # Buckets are stored non-cumulative and summed up when exposed
+        bucket = next((b for b in self.buckets if value <= b), "+Inf")
+        counters.add(_key(f"{self.name}_bucket", {**labels, "le": str(bucket)}), 1)
+        counters.add(_key(f"{self.name}_sum", labels), value)
+        counters.add(_key(f"{self.name}_count", labels), 1)
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect_samples():
+    """Sum the values written by every process, by sample key."""
+    directory = Path(settings.METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    totals = defaultdict(float)
+
+    # Only one process at a time may fold dead workers into the archive
+    with open(directory / ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive = None
+        for path in sorted(directory.glob("*_*.db")):
+            kind, _, pid = path.stem.rpartition("_")
+            if path.name == ARCHIVE_NAME or not pid.isdigit():
+                continue
+            values = read_file(path)
+            if _is_alive(int(pid)):
+                for key, value in values.items():
+                    totals[key] += value
+                continue
+
+            if kind == "counter":
+                if archive is None:
+                    archive = MmapFile(directory / ARCHIVE_NAME)
+                for key, value in values.items():
+                    archive.add(key, value)
+            path.unlink()
+
+        if (directory / ARCHIVE_NAME).exists():
+            for key, value in read_file(directory / ARCHIVE_NAME).items():
+                totals[key] += value
+
+    return totals
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format."""
+    samples = defaultdict(list)
+    for key, value in collect_samples().items():
+        name, labels = json.loads(key)
+        samples[name].append((labels, value))
+
+    lines = []
+    for metric in _registry.values():
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        if isinstance(metric, Histogram):
+            lines.extend(_histogram_lines(metric, samples))
+        else:
+            for labels, value in samples.get(metric.name, ()):
+                lines.append(_sample_line(metric.name, labels, value))
+
+    for collector in _collectors():
+        for metric_type, name, documentation, metric_samples in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in metric_samples:
+                lines.append(_sample_line(name, labels, value))
+
+    return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(metric, samples):
+    buckets = defaultdict(dict)
+    for labels, value in samples.get(f"{metric.name}_bucket", ()):
+        le = labels.pop("le")
+        buckets[json.dumps(labels, sort_keys=True)][le] = value
+
+    for series, counts in buckets.items():
+        labels = json.loads(series)
+        cumulative = 0
+        for bucket in (*metric.buckets, "+Inf"):
+            cumulative += counts.get(str(bucket), 0)
+            yield _sample_line(
+                f"{metric.name}_bucket", {**labels, "le": str(bucket)}, cumulative
+            )
+    for suffix in ("_sum", "_count"):
+        for labels, value in samples.get(metric.name + suffix, ()):
+            yield _sample_line(metric.name + suffix, labels, value)
+
+
+def _sample_line(name, labels, value):
+    if labels:
+        pairs = ",".join(
+            f'{label}="{_escape(labels[label])}"' for label in sorted(labels)
+        )
+        name = f"{name}{{{pairs}}}"
+    # Collectors may return ints, which have no is_integer() before 3.12
+    value = float(value)
+    return f"{name} {int(value) if value.is_integer() else value!r}"
+
+
+def _escape(value):
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+@cache
+def _collectors():
+    return [import_string(path) for path in settings.METRICS_COLLECTORS]
+
+
+REQUESTS = Counter(
+    "divvywonga_http_requests_total",
+    "HTTP responses by URL name, method and status code.",
+    ["view", "method", "status"],
+)
+REQUEST_DURATION = Histogram(
+    "divvywonga_http_request_duration_seconds",
+    "Time to produce a response, by URL name.",
+    ["view"],
+)
+DB_QUERIES = Counter(
+    "divvywonga_db_queries_total",
+    "Database queries run while serving requests, by database alias.",
+    ["alias"],
+)
+DB_QUERY_SECONDS = Counter(
+    "divvywonga_db_query_duration_seconds_total",
+    "Time spent in database queries while serving requests, by database alias.",
+    ["alias"],
+)
+CACHE_REQUESTS = Counter(
+    "divvywonga_cache_requests_total",
+    "Cache lookups by cache alias and result (hit or miss).",
+    ["cache", "result"],
+)
+RATE_LIMITED = Counter(
+    "divvywonga_rate_limited_total",
+    "Requests refused by the rate limiter, by URL name and bucket (ip or user).",
+    ["view", "scope"],
+)
+SSE_SUBSCRIPTIONS = Gauge(
+    "divvywonga_sse_subscriptions",
+    "Open live update (Server-Sent Events) connections.",
+)
+SSE_RESYNCS = Counter(
+    "divvywonga_sse_resyncs_total",
+    "Live update connections whose queue overflowed and were told to resync.",
+)
@@ -0,0 +1,422 @@
+import cProfile
+import json
+import math
+import mimetypes
+import random
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import FileResponse, HttpResponse
+from core import ratelimit
+from core.metrics import (
+    DB_QUERIES,
+    DB_QUERY_SECONDS,
+    RATE_LIMITED,
+    REQUEST_DURATION,
+    REQUESTS,
+)
+from core.profiling import save_profile
+
+# Hashed file names never change content, so browsers may keep them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=60"
+
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def accepted_encodings(header):
+    """Map each coding in an Accept-Encoding header to its q-value."""
+    accepted = {}
+    for item in header.split(","):
+        coding, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding.strip():
+            accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+class StaticFile:
+    """A collected static file and its precompressed variants."""
+
+    def __init__(self, path, immutable):
+        self.path = path
+        self.content_type = (
+            mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        )
+        self.cache_control = (
+            IMMUTABLE_CACHE_CONTROL if immutable else DEFAULT_CACHE_CONTROL
+        )
+        self.variants = [
+            (encoding, path.with_name(path.name + suffix))
+            for encoding, suffix in ENCODINGS
+            if path.with_name(path.name + suffix).exists()
+        ]
+
+    def response(self, request):
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        path, encoding, best = self.path, None, 0
+        # Variants are in order of preference, which breaks ties in q-value
+        for variant_encoding, variant_path in self.variants:
+            quality = accepted.get(variant_encoding, accepted.get("*", 0))
+            if quality > best:
+                path, encoding, best = variant_path, variant_encoding, quality
+
+        response = FileResponse(path.open("rb"), content_type=self.content_type)
+        response["Cache-Control"] = self.cache_control
+        if encoding:
+            response["Content-Encoding"] = encoding
+        if self.variants:
+            response["Vary"] = "Accept-Encoding"
+        return response
+
+
+# Query counts and seconds by database alias for the request being served,
+# set by MetricsMiddleware. A context variable also reaches the threads that
+# run the sync parts of an async request, which have their own connections.
+_request_queries = ContextVar("request_queries", default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    queries = _request_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        totals = queries[context["connection"].alias]
+        totals[0] += 1
+        totals[1] += time.perf_counter() - start
+
+
+def _install_query_counter(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        # First, as connection.execute_wrapper() removes the last wrapper
+        connection.execute_wrappers.insert(0, _count_query)
+
+
+class MetricsMiddleware:
+    """
+    Record the latency and status of every response by URL name, and the
+    queries run on each database while producing it, in core.metrics.
+    Requests that match no URL (static files, 404s) are labelled "unmatched".
+
+    Queries are counted by a wrapper installed on every connection as it is
+    opened, so under ASGI the middleware runs as a coroutine and still sees
+    the queries of the views run in threads.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+        connection_created.connect(_install_query_counter, dispatch_uid=__name__)
+        for connection in connections.all(initialized_only=True):
+            _install_query_counter(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        queries = defaultdict(lambda: [0, 0.0])
+        token = _request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self._record(request, response, time.perf_counter() - start, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = defaultdict(lambda: [0, 0.0])
+        token = _request_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self._record(request, response, time.perf_counter() - start, queries)
+        return response
+
+    def _record(self, request, response, duration, queries):
+        match = request.resolver_match
+        view = match.view_name if match and match.url_name else "unmatched"
+        REQUEST_DURATION.observe(duration, view=view)
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        for alias, (count, seconds) in queries.items():
+            DB_QUERIES.inc(count, alias=alias)
+            DB_QUERY_SECONDS.inc(seconds, alias=alias)
+
+
+class StaticFilesMiddleware:
+    """
+    Serve files collected into STATIC_ROOT before the rest of the middleware
+    stack runs, preferring the brotli/gzip copies written by
+    core.storage.CompressedManifestStaticFilesStorage.
+
+    The files are indexed once on the first static request; run collectstatic
+    before (re)starting the app.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self._files = None
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @property
+    def files(self):
+        if self._files is None:
+            self._files = self._index(Path(settings.STATIC_ROOT))
+        return self._files
+
+    def _index(self, root):
+        if not root.is_dir():
+            return {}
+
+        manifest = root / "staticfiles.json"
+        hashed = set()
+        if manifest.exists():
+            hashed = set(json.loads(manifest.read_text())["paths"].values())
+
+        files = {}
+        for path in root.rglob("*"):
+            if not path.is_file() or path.suffix in (".br", ".gz"):
+                continue
+            name = path.relative_to(root).as_posix()
+            files[name] = StaticFile(path, immutable=name in hashed)
+        return files
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        static_file = self._find(request)
+        if static_file is not None:
+            return static_file.response(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        static_file = self._find(request)
+        if static_file is not None:
+            return static_file.response(request)
+        return await self.get_response(request)
+
+    def _find(self, request):
+        if request.method in ("GET", "HEAD") and request.path.startswith(self.prefix):
+            return self.files.get(request.path[len(self.prefix) :])
+        return None
+
+
+class RateLimitMiddleware:
+    """
+    Refuse POSTs to the URL names in RATELIMITS with a 429 once one of the
+    client's token buckets (core.ratelimit) is empty; a refused request takes
+    no tokens from the others. The "ip" bucket is keyed by the client
+    address; the "user" bucket by the logged-in user's id from the session,
+    or for the login form by the posted username.
+
+    Runs before the views and the group shard lookup, so refused requests
+    cost no password hashing and no queries beyond loading the session
+    (with the async session API under ASGI).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django awaits a coroutine process_view in the request's task
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        limits = self._limits(request)
+        if not limits:
+            return None
+        return self._limit(request, limits, request.session.get(SESSION_KEY))
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        limits = self._limits(request)
+        if not limits:
+            return None
+        user_id = await request.session.aget(SESSION_KEY)
+        return self._limit(request, limits, user_id)
+
+    def _limits(self, request):
+        if request.method != "POST":
+            return None
+        return settings.RATELIMITS.get(request.resolver_match.url_name)
+
+    def _limit(self, request, limits, user_id):
+        view = request.resolver_match.view_name
+        scopes, buckets = [], []
+        for scope, (capacity, seconds) in limits.items():
+            client = self._client(request, scope, user_id)
+            if client is not None:
+                scopes.append(scope)
+                buckets.append((f"{view}:{scope}:{client}", capacity, seconds))
+
+        # Every bucket is checked before any is debited
+        waits = ratelimit.take(buckets)
+        if not any(waits):
+            return None
+
+        for scope, wait in zip(scopes, waits, strict=True):
+            if wait:
+                RATE_LIMITED.inc(view=view, scope=scope)
+        response = HttpResponse(
+            "Too many requests. Please try again later.",
+            content_type="text/plain",
+            status=429,
+        )
+        response["Retry-After"] = str(math.ceil(max(waits)))
+        return response
+
+    def _client(self, request, scope, user_id):
+        if scope == "ip":
+            return request.META.get("REMOTE_ADDR")
+        if user_id is not None:
+            return f"id:{user_id}"
+        username = request.POST.get("username", "").strip().lower()
+        return f"name:{username}" if username else None
+
+
+class ProfilingMiddleware:
+    """
+    Run a view under cProfile, tracing its SQL, when a staff user adds the
+    PROFILE_QUERY_PARAM to the URL (e.g. ?profile=1) or the request is picked
+    at PROFILE_SAMPLE_RATE. Profiles are saved by core.profiling and listed
+    on the staff profiles page.
+
+    Other requests only pay for a query string lookup and a random draw.
+
+    Profiling stays synchronous: cProfile only sees the thread it runs in,
+    so a profiled view is called directly in the request's sync thread
+    (under ASGI through sync_to_async). The middleware itself is still
+    async-capable, since a sync-only middleware makes Django run every
+    middleware outside it synchronously as well.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django awaits a coroutine process_view in the request's task
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Streaming async views (the SSE events) can't be profiled as a call
+        if iscoroutinefunction(view_func) or not self._triggered(request):
+            return None
+        return self._profile(request, view_func, view_args, view_kwargs)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if iscoroutinefunction(view_func) or not await self._atriggered(request):
+            return None
+        return await sync_to_async(self._profile)(
+            request, view_func, view_args, view_kwargs
+        )
+
+    def _profile(self, request, view_func, view_args, view_kwargs):
+        queries = []
+
+        def trace(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append(
+                    {
+                        "alias": context["connection"].alias,
+                        "sql": sql,
+                        "ms": round((time.perf_counter() - start) * 1000, 2),
+                    }
+                )
+
+        view_class = getattr(view_func, "view_class", None)
+        view_name = (view_class or view_func).__name__
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(trace))
+            profiler.enable()
+            try:
+                response = view_func(request, *view_args, **view_kwargs)
+                # Render template responses here so rendering is profiled too
+                if hasattr(response, "render") and callable(response.render):
+                    response = response.render()
+            finally:
+                profiler.disable()
+                save_profile(
+                    profiler,
+                    queries,
+                    request,
+                    view_name,
+                    view_kwargs.get("group_id"),
+                    time.perf_counter() - start,
+                )
+        return response
+
+    def _triggered(self, request):
+        if settings.PROFILE_QUERY_PARAM in request.GET:
+            return request.user.is_staff
+        return self._sampled()
+
+    async def _atriggered(self, request):
+        if settings.PROFILE_QUERY_PARAM in request.GET:
+            return (await request.auser()).is_staff
+        return self._sampled()
+
+    def _sampled(self):
+        rate = settings.PROFILE_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
@@ -0,0 +1,97 @@
+"""
+Storage for the request profiles taken by core.middleware.ProfilingMiddleware.
+
+Each profile is saved in PROFILE_DIR as a pstats dump (<name>.prof, readable
+with pstats or snakeviz) and a JSON summary (<name>.json) with the request
+details, the SQL trace and the top hotspots shown on the staff profiles page.
+"""
+
+import json
+import pstats
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+HOTSPOT_COUNT = 15
+
+# Profile names only ever contain these characters, see save_profile
+NAME_PATTERN = re.compile(r"^[\w-]+$")
+
+
+def save_profile(profiler, queries, request, view_name, group_id, duration):
+    """Write the profile of one request and return its name."""
+    directory = Path(settings.PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    created_at = timezone.now()
+    name = f"{created_at:%Y%m%d-%H%M%S-%f}-{view_name}"
+    if group_id is not None:
+        name += f"-group{group_id}"
+
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(directory / f"{name}.prof")
+
+    summary = {
+        "name": name,
+        "view": view_name,
+        "group_id": group_id,
+        "method": request.method,
+        "path": request.path,
+        "user": request.user.get_username() if hasattr(request, "user") else "",
+        "created_at": created_at.isoformat(),
+        "duration_ms": round(duration * 1000, 2),
+        "query_ms": round(sum(query["ms"] for query in queries), 2),
+        "queries": queries,
+        "hotspots": _hotspots(stats),
+    }
+    (directory / f"{name}.json").write_text(json.dumps(summary))
+
+    _prune(directory)
+    return name
+
+
+def _hotspots(stats):
+    """The functions with the most time spent in their own code."""
+    # stats.stats maps (file, line, function) to
+    # (primitive calls, calls, own time, cumulative time, callers)
+    entries = sorted(stats.stats.items(), key=lambda entry: entry[1][2], reverse=True)
+    return [
+        {
+            "function": f"{function} ({Path(file).name}:{line})",
+            "calls": calls,
+            "own_ms": round(own_time * 1000, 2),
+            "cumulative_ms": round(cumulative_time * 1000, 2),
+        }
+        for (file, line, function), (_, calls, own_time, cumulative_time, _) in entries[
+            :HOTSPOT_COUNT
+        ]
+    ]
+
+
+def _prune(directory):
+    """Keep the PROFILE_KEEP most recent profiles."""
+    summaries = sorted(directory.glob("*.json"), reverse=True)
+    for summary in summaries[settings.PROFILE_KEEP :]:
+        summary.unlink(missing_ok=True)
+        summary.with_suffix(".prof").unlink(missing_ok=True)
+
+
+def recent_profiles():
+    """Summaries of the saved profiles, newest first."""
+    directory = Path(settings.PROFILE_DIR)
+    if not directory.is_dir():
+        return []
+    return [
+        json.loads(path.read_text())
+        for path in sorted(directory.glob("*.json"), reverse=True)
+    ]
+
+
+def profile_path(name):
+    """Path of a profile's pstats dump, or None if there is no such profile."""
+    if not NAME_PATTERN.match(name):
+        return None
+    path = Path(settings.PROFILE_DIR) / f"{name}.prof"
+    return path if path.is_file() else None
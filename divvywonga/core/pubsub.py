@@ -0,0 +1,113 @@
+"""
+Publish/subscribe used to push live updates to Server-Sent Events streams.
+
+The broker class is configured with the PUBSUB_BACKEND setting. The default
+InProcessBroker only reaches subscribers connected to the same process; a
+backend wrapping an external (or local stand-in) broker can replace it by
+implementing publish/subscribe/unsubscribe.
+"""
+
+import asyncio
+import threading
+from collections import defaultdict
+from functools import cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from core.metrics import SSE_RESYNCS, SSE_SUBSCRIPTIONS
+
+
+class Subscription:
+    """
+    A bounded queue of messages for one connection on one channel.
+
+    When a slow client lets the queue fill up, pending messages are dropped
+    and a single None is queued instead so the stream can tell the client
+    to resync rather than buffering without limit.
+    """
+
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def deliver(self, message):
+        """Queue a message; must run on the subscriber's event loop."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            SSE_RESYNCS.inc()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout):
+        """Wait for the next message, raising asyncio.TimeoutError when idle."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class BaseBroker:
+    """Interface every PUBSUB_BACKEND must implement."""
+
+    def publish(self, channel, message):
+        """Send an already serialized message to every subscriber of a channel."""
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        """Return a Subscription; must be called from the event loop."""
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class InProcessBroker(BaseBroker):
+    """Broker delivering messages to subscribers in the current process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+
+        # Publishers may run in a sync worker thread, so hand the message over
+        # to each subscriber's loop instead of touching its queue directly
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # The subscriber's loop has been closed
+                self.unsubscribe(subscription)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, settings.SSE_QUEUE_SIZE)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        SSE_SUBSCRIPTIONS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is None or subscription not in subscriptions:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.channel]
+        SSE_SUBSCRIPTIONS.dec()
+
+
+@cache
+def get_broker():
+    """Return the process-wide broker configured by PUBSUB_BACKEND."""
+    return import_string(settings.PUBSUB_BACKEND)()
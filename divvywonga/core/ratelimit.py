@@ -0,0 +1,117 @@
+"""
+Token bucket rate limiting shared by every worker process.
+
+The buckets live in a fixed-size table in a memory-mapped file
+(RATELIMIT_FILE), so a client's requests count against the same bucket
+whichever gunicorn worker serves them. A bucket is found by a hash of its key
+with a few linear probes; when all probed slots are taken, the one updated
+longest ago is reused, which at worst gives that client a full bucket again.
+Updates hold an flock on the file, so each takes a few microseconds and no
+database work.
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+SLOTS = 8192
+PROBES = 8
+SLOT = struct.Struct("Qdd")  # key hash (0 if empty), tokens, last update time
+
+
+class BucketTable:
+    """The shared bucket table, reopened after a fork like core.metrics files."""
+
+    def __init__(self):
+        self._pid = None
+        self._path = None
+        self._file = None
+        self._map = None
+        self._lock = threading.Lock()
+
+    def _open(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if self._file is not None:
+            self._map.close()
+            self._file.close()
+        self._file = open(path, "a+b")  # noqa: SIM115 - stays open for the mmap
+        if os.fstat(self._file.fileno()).st_size < SLOTS * SLOT.size:
+            self._file.truncate(SLOTS * SLOT.size)
+        self._map = mmap.mmap(self._file.fileno(), SLOTS * SLOT.size)
+        self._pid = os.getpid()
+        self._path = path
+
+    def take(self, buckets):
+        """
+        Take a token from each of `buckets`, given as (key, capacity, seconds)
+        for a bucket that holds `capacity` tokens and refills completely in
+        `seconds`. Tokens are only taken if every bucket has one, so a request
+        refused by one bucket doesn't use up the others.
+
+        Return the wait of each bucket: 0 if it had a token, else the seconds
+        until its next one is available.
+        """
+        now = time.time()
+        path = Path(settings.RATELIMIT_FILE)
+        with self._lock:
+            if self._pid != os.getpid() or self._path != path:
+                # The flock of a forked child would be shared with its parent,
+                # and tests point RATELIMIT_FILE elsewhere
+                self._open(path)
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                slots = []
+                for key, capacity, seconds in buckets:
+                    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+                    key_hash = int.from_bytes(digest, "big") or 1
+                    pos, tokens, updated = self._find(key_hash)
+                    rate = capacity / seconds
+                    if tokens is None:
+                        tokens = capacity
+                    else:
+                        tokens = min(capacity, tokens + (now - updated) * rate)
+                    # Store the refill right away, so the next bucket can't
+                    # pick the same free slot
+                    SLOT.pack_into(self._map, pos, key_hash, tokens, now)
+                    slots.append((pos, key_hash, tokens, rate))
+
+                waits = [
+                    0 if tokens >= 1 else (1 - tokens) / rate
+                    for _, _, tokens, rate in slots
+                ]
+                if not any(waits):
+                    for pos, key_hash, tokens, _ in slots:
+                        SLOT.pack_into(self._map, pos, key_hash, tokens - 1, now)
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+        return waits
+
+    def _find(self, key_hash):
+        """Return (position, tokens, updated) of the bucket's slot, with None
+        tokens if the bucket is new."""
+        first = key_hash % SLOTS
+        reuse = None
+        for probe in range(PROBES):
+            pos = (first + probe) % SLOTS * SLOT.size
+            slot_hash, tokens, updated = SLOT.unpack_from(self._map, pos)
+            if slot_hash == key_hash:
+                return pos, tokens, updated
+            if slot_hash == 0:
+                return pos, None, None
+            if reuse is None or updated < reuse[1]:
+                reuse = (pos, updated)
+        return reuse[0], None, None
+
+
+_table = BucketTable()
+
+
+def take(buckets):
+    return _table.take(buckets)
@@ -31,8 +31,9 @@ ALLOWED_HOSTS = []
 
 # Application definition
 
+# The admin and tinymce are loaded lazily, see core.apps
 INSTALLED_APPS = [
-    "django.contrib.admin",
+    "core.apps.LazyAdminConfig",
     "django.contrib.auth",
     "django.contrib.contenttypes",
     "django.contrib.sessions",
@@ -42,17 +43,22 @@ INSTALLED_APPS = [
     "core",
     "crispy_forms",
     "crispy_bootstrap5",
-    "tinymce",
+    "core.apps.LazyTinyMCEConfig",
 ]
 
 MIDDLEWARE = [
+    "core.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "core.middleware.StaticFilesMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.middleware.RateLimitMiddleware",
+    "users.middleware.ShardMiddleware",
+    "core.middleware.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "divvywonga.urls"
@@ -73,18 +79,91 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "divvywonga.wsgi.application"
+ASGI_APPLICATION = "divvywonga.asgi.application"
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.environ.get('DATABASE_PATH', '/app/data/db.sqlite3'),
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ.get("DATABASE_PATH", "/app/data/db.sqlite3"),
     }
 }
 
+# Group data (users.Group and users.Membership) is split over DATABASE_SHARDS
+# SQLite files by users.routers.ShardRouter. Shard 0 is the default database;
+# shard N is stored next to it as e.g. db.shardN.sqlite3. Every shard has to
+# be migrated: `manage.py migrate --database shard_N`. The sharding tests
+# only run with DATABASE_SHARDS=2 or more.
+
+DATABASE_SHARDS = int(os.environ.get("DATABASE_SHARDS", "1"))
+
+for shard in range(1, DATABASE_SHARDS):
+    default_path = Path(DATABASES["default"]["NAME"])
+    DATABASES[f"shard_{shard}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": default_path.with_name(
+            f"{default_path.stem}.shard{shard}{default_path.suffix}"
+        ),
+    }
+
+DATABASE_ROUTERS = ["users.routers.ShardRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# LocMemCache is per process; set CACHE_BACKEND to a shared backend (Redis,
+# Memcached, ...) when running several workers.
+
+# core.cache.MeteredCache wraps the backend to count hits and misses.
+
+CACHE_BACKEND = os.environ.get(
+    "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+)
+CACHES = {
+    "default": {
+        "BACKEND": "core.cache.MeteredCache",
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+        "OPTIONS": {
+            "BACKEND": CACHE_BACKEND,
+            "ALIAS": "default",
+        },
+    }
+}
+
+# Whether every worker process sees the same cache entries
+SHARED_CACHE = CACHE_BACKEND not in (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+# Sessions and authentication
+# With a shared cache, sessions are read from the cache and only fall back to
+# the database on a miss, and authenticated users are cached by
+# users.backends.CachedModelBackend. A per-process cache would keep serving
+# sessions and users that another worker logged out, flushed or deactivated,
+# so without one both are read from the database.
+
+SESSION_ENGINE = (
+    "django.contrib.sessions.backends.cached_db"
+    if SHARED_CACHE
+    else "django.contrib.sessions.backends.db"
+)
+SESSION_CACHE_ALIAS = os.environ.get("SESSION_CACHE_ALIAS", "default")
+
+AUTHENTICATION_BACKENDS = [
+    "users.backends.CachedModelBackend"
+    if SHARED_CACHE
+    else "django.contrib.auth.backends.ModelBackend"
+]
+AUTH_USER_CACHE_ALIAS = os.environ.get("AUTH_USER_CACHE_ALIAS", "default")
+AUTH_USER_CACHE_TIMEOUT = 300  # seconds
+
+# Keep flash messages in a cookie so setting them doesn't write the session
+MESSAGE_STORAGE = "django.contrib.messages.storage.cookie.CookieStorage"
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,6 +200,18 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = "static/"
+STATIC_ROOT = os.environ.get("STATIC_ROOT", BASE_DIR / "staticfiles")
+
+# Vendored assets are collected with hashed names and precompressed copies,
+# then served by core.middleware.StaticFilesMiddleware with far-future caching
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "core.storage.CompressedManifestStaticFilesStorage",
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -133,3 +224,58 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 LOGIN_REDIRECT_URL = "index"
 LOGIN_URL = "login"
+
+# Live group updates (Server-Sent Events)
+PUBSUB_BACKEND = "core.pubsub.InProcessBroker"
+SSE_HEARTBEAT_INTERVAL = 15  # seconds
+SSE_QUEUE_SIZE = 100  # pending messages per connection before forcing a resync
+
+# On-demand request profiling (core.middleware.ProfilingMiddleware). Staff
+# users add ?profile=1 to a URL; PROFILE_SAMPLE_RATE (0 to 1) also profiles
+# that share of all requests. The PROFILE_KEEP latest profiles are kept.
+PROFILE_DIR = os.environ.get(
+    "PROFILE_DIR", Path(DATABASES["default"]["NAME"]).parent / "profiles"
+)
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_KEEP = 100
+
+# Rate limits (core.middleware.RateLimitMiddleware) for POSTs to these URL
+# names, as token buckets of (burst size, seconds to refill it) per client IP
+# and per user. The buckets are kept in RATELIMIT_FILE, which must be shared
+# by all the workers of a deployment.
+RATELIMITS = {
+    "login": {"ip": (20, 60), "user": (5, 60)},
+    "register": {"ip": (5, 600)},
+    "invite_to_group": {"ip": (30, 60), "user": (10, 60)},
+}
+RATELIMIT_FILE = os.environ.get(
+    "RATELIMIT_FILE", Path(DATABASES["default"]["NAME"]).parent / "ratelimit.db"
+)
+
+# Prometheus metrics (core.metrics). Every worker process writes its own
+# files in METRICS_DIR, which /metrics adds up; it must be shared by all the
+# workers of a deployment. METRICS_COLLECTORS compute more values at scrape time.
+METRICS_DIR = os.environ.get(
+    "METRICS_DIR", Path(DATABASES["default"]["NAME"]).parent / "metrics"
+)
+METRICS_COLLECTORS = ["users.rollups.collect_metrics"]
+# Besides staff users, only these client addresses or networks (comma
+# separated, e.g. "10.0.0.0/8") may read /metrics.
+METRICS_ALLOWED_IPS = [
+    network.strip()
+    for network in os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+    if network.strip()
+]
+
+# Tests record their metrics in a temporary METRICS_DIR
+TEST_RUNNER = "core.test_runner.TestRunner"
+
+# Import time budgets for process startup, in milliseconds per app (label) or
+# top-level package, and "total" for everything. Checked by core.tests and
+# `manage.py profile_imports --check`.
+STARTUP_IMPORT_BUDGETS = {
+    "total": 1000,
+    "users": 50,
+    "core": 20,
+}
@@ -0,0 +1,55 @@
+import gzip
+
+import brotli
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".map", ".svg", ".txt", ".json", ".html")
+# Below this size the compressed copy isn't worth a second lookup
+MIN_COMPRESS_SIZE = 256
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Hashed-manifest static storage that also writes .gz and .br copies of
+    text assets at collectstatic time, for core.middleware.StaticFilesMiddleware
+    to serve.
+
+    Files missing from the manifest (collectstatic hasn't run, e.g. in tests)
+    are linked by their plain name instead of failing the page.
+    """
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not collected, so there is no file to hash either
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        for name in self.hashed_files.values():
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self._compress(name)
+
+    def _compress(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+
+        variants = (
+            (".gz", gzip.compress(content, compresslevel=9, mtime=0)),
+            (".br", brotli.compress(content)),
+        )
+        for extension, compressed in variants:
+            if len(compressed) >= len(content):
+                continue
+            if self.exists(name + extension):
+                self.delete(name + extension)
+            self._save(name + extension, ContentFile(compressed))
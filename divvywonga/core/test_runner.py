@@ -0,0 +1,23 @@
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Test runner that points METRICS_DIR at a temporary directory for the
+    whole run, so the metrics recorded by test requests never reach the
+    files of a running deployment.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._metrics_dir = tempfile.TemporaryDirectory()
+        self._metrics_settings = override_settings(METRICS_DIR=self._metrics_dir.name)
+        self._metrics_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._metrics_settings.disable()
+        self._metrics_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
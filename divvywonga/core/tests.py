@@ -1,3 +1,325 @@
-from django.test import TestCase
+import asyncio
+import multiprocessing
+import re
+import sqlite3
+import tempfile
+from contextlib import closing
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.templatetags.static import static
+from django.urls import reverse
+
+from core.importtime import LAZY_MODULES, over_budget, profile_startup
+from core.metrics import (
+    CACHE_REQUESTS,
+    DB_QUERIES,
+    RATE_LIMITED,
+    SSE_SUBSCRIPTIONS,
+    _key,
+    _sample_line,
+    collect_samples,
+)
+from core.middleware import StaticFile, accepted_encodings
+from core.profiling import recent_profiles
+from core.pubsub import InProcessBroker
+
+
+class StartupImportTests(SimpleTestCase):
+    """Keep process startup within STARTUP_IMPORT_BUDGETS."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.times = profile_startup()
+
+    def test_import_time_within_budget(self):
+        self.assertEqual(over_budget(self.times), {})
+
+    def test_lazy_modules_not_imported_at_startup(self):
+        self.assertEqual(LAZY_MODULES & self.times.keys(), set())
+
+    def test_tinymce_not_imported_by_other_urls(self):
+        times = profile_startup(urls=True)
+        self.assertEqual({"tinymce.urls", "tinymce.views"} & times.keys(), set())
+
+
+class StaticFileTests(SimpleTestCase):
+    """Encoding negotiation of StaticFilesMiddleware and uncollected assets."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "app.js"
+        for suffix in ("", ".gz", ".br"):
+            self.path.with_name(self.path.name + suffix).write_bytes(b"x")
+        self.file = StaticFile(self.path, immutable=True)
+
+    def encoding(self, accept_encoding):
+        request = RequestFactory().get(
+            "/", headers={"accept-encoding": accept_encoding}
+        )
+        response = self.file.response(request)
+        response.close()
+        return response.get("Content-Encoding")
+
+    def test_accepted_encodings(self):
+        self.assertEqual(
+            accepted_encodings("gzip;q=0, identity, br; q=0.5, *;q=bad"),
+            {"gzip": 0.0, "identity": 1.0, "br": 0.5, "*": 0.0},
+        )
+
+    def test_refused_encoding_is_not_served(self):
+        self.assertIsNone(self.encoding("gzip;q=0, identity"))
+        self.assertIsNone(self.encoding(""))
+
+    def test_highest_quality_wins(self):
+        self.assertEqual(self.encoding("br;q=0.5, gzip"), "gzip")
+        self.assertEqual(self.encoding("gzip, br"), "br")
+        self.assertEqual(self.encoding("*"), "br")
+
+    def test_assets_are_not_loaded_from_other_hosts(self):
+        external = re.compile(
+            r'<script[^>]* src="https?:|<link[^>]* href="https?:|@import url\(["\']?https?:'
+        )
+        for app in ("core", "users"):
+            for path in (settings.BASE_DIR / app).glob("**/*.*"):
+                if path.suffix in (".html", ".css"):
+                    with self.subTest(path=path):
+                        self.assertIsNone(external.search(path.read_text()))
+
+    def test_uncollected_asset_uses_plain_name(self):
+        with override_settings(DEBUG=False, STATIC_ROOT=self.path.parent):
+            self.assertEqual(static("vendor/app.js"), "/static/vendor/app.js")
+
+
+class BackupTests(SimpleTestCase):
+    """The backup_db command."""
+
+    def test_backup_is_a_complete_copy(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # "?" and "#" would end the path of an unescaped file: URI
+        source = Path(directory.name) / "data #1?.sqlite3"
+        with closing(sqlite3.connect(source)) as db, db:
+            db.execute("CREATE TABLE entry (id INTEGER PRIMARY KEY, body TEXT)")
+            db.executemany("INSERT INTO entry (body) VALUES (?)", [("x" * 500,)] * 300)
+        databases = {
+            **settings.DATABASES,
+            "backup": {"ENGINE": "django.db.backends.sqlite3", "NAME": source},
+        }
+
+        target = Path(directory.name) / "backups"
+        with mock.patch.dict(settings.DATABASES, databases):
+            call_command(
+                "backup_db", target, database=["backup"], pages=8, stdout=StringIO()
+            )
+
+        (backup,) = target.iterdir()
+        self.assertTrue(backup.name.startswith("data #1?-"))
+        with closing(sqlite3.connect(backup)) as db:
+            self.assertEqual(db.execute("PRAGMA integrity_check").fetchone(), ("ok",))
+            self.assertEqual(
+                db.execute("SELECT count(*) FROM entry").fetchone(), (300,)
+            )
+
+
+class MiddlewareTests(SimpleTestCase):
+    @override_settings(DEBUG=True)
+    def test_middleware_runs_natively_under_asgi(self):
+        # In debug mode Django logs every middleware it has to adapt with a
+        # thread switch
+        with self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler()
+
+
+class SubscriptionTests(SimpleTestCase):
+    """Bounded delivery of pub/sub messages to live update streams."""
+
+    async def test_publish_reaches_channel_subscribers(self):
+        broker = InProcessBroker()
+        subscription = broker.subscribe("group:1")
+        other = broker.subscribe("group:2")
+        broker.publish("group:1", "hello")
+
+        self.assertEqual(await subscription.get(1), "hello")
+        with self.assertRaises(asyncio.TimeoutError):
+            await other.get(0.01)
+
+    @override_settings(SSE_QUEUE_SIZE=2)
+    async def test_overflow_replaces_pending_messages_with_resync(self):
+        subscription = InProcessBroker().subscribe("group:1")
+        for message in ("1", "2", "3", "4"):
+            subscription.deliver(message)
+
+        self.assertIsNone(await subscription.get(1))
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_closed_subscription_gets_nothing(self):
+        broker = InProcessBroker()
+        subscription = broker.subscribe("group:1")
+        subscription.close()
+        broker.publish("group:1", "hello")
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await subscription.get(0.01)
+
+
+class RateLimitTests(TestCase):
+    """429 responses of RateLimitMiddleware from the shared token buckets."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            RATELIMIT_FILE=Path(directory.name) / "ratelimit.db",
+            RATELIMITS={
+                "login": {"ip": (3, 60), "user": (1, 60)},
+                "register": {"ip": (1, 600)},
+            },
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def log_in(self, username):
+        return self.client.post(
+            reverse("login"), {"username": username, "password": "wrong"}
+        )
+
+    def test_refused_request_gets_retry_after(self):
+        self.assertEqual(self.client.post(reverse("register")).status_code, 200)
+        response = self.client.post(reverse("register"))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "600")
+
+    def test_refused_request_takes_no_tokens(self):
+        self.assertEqual(self.log_in("alice").status_code, 200)
+        response = self.log_in("Alice")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "60")
+
+        # The refusal by alice's user bucket left the IP bucket two tokens
+        self.assertEqual(self.log_in("bob").status_code, 200)
+        self.assertEqual(self.log_in("carol").status_code, 200)
+        self.assertEqual(self.log_in("dave").status_code, 429)
+
+    async def test_async_requests_are_limited(self):
+        url = reverse("register")
+        self.assertEqual((await self.async_client.post(url)).status_code, 200)
+        self.assertEqual((await self.async_client.post(url)).status_code, 429)
+
+
+def _count_in_worker(started, stop):
+    RATE_LIMITED.inc(2, view="login", scope="ip")
+    SSE_SUBSCRIPTIONS.inc()
+    started.set()
+    stop.wait(10)
+
+
+class MetricsTests(TestCase):
+    """Metrics summed over worker processes, and access to /metrics."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(METRICS_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def sample(self, metric, **labels):
+        return collect_samples().get(_key(metric.name, labels), 0)
+
+    def test_values_are_summed_over_processes(self):
+        context = multiprocessing.get_context("fork")
+        started, stop = context.Event(), context.Event()
+        worker = context.Process(target=_count_in_worker, args=(started, stop))
+        worker.start()
+        self.addCleanup(worker.join)
+        self.addCleanup(stop.set)
+        self.assertTrue(started.wait(10))
+
+        RATE_LIMITED.inc(view="login", scope="ip")
+        SSE_SUBSCRIPTIONS.inc()
+        self.assertEqual(self.sample(RATE_LIMITED, view="login", scope="ip"), 3)
+        self.assertEqual(self.sample(SSE_SUBSCRIPTIONS), 2)
+
+        # An exited worker's counters are kept and its gauges dropped
+        stop.set()
+        worker.join()
+        self.assertEqual(self.sample(RATE_LIMITED, view="login", scope="ip"), 3)
+        self.assertEqual(self.sample(SSE_SUBSCRIPTIONS), 1)
+        RATE_LIMITED.inc(view="login", scope="ip")
+        self.assertEqual(self.sample(RATE_LIMITED, view="login", scope="ip"), 4)
+
+    def test_sample_values(self):
+        self.assertEqual(_sample_line("jobs", {}, 3), "jobs 3")
+        self.assertEqual(_sample_line("jobs", {}, 3.0), "jobs 3")
+        self.assertEqual(_sample_line("seconds", {"q": "a"}, 0.5), 'seconds{q="a"} 0.5')
+
+    async def test_queries_of_async_requests_are_counted(self):
+        await self.async_client.get(reverse("login"))
+        before = self.sample(DB_QUERIES, alias="default")
+        user = await User.objects.acreate_user("alice", password="pw")
+        await self.async_client.aforce_login(user)
+        await self.async_client.get(reverse("login"))
+        self.assertGreater(self.sample(DB_QUERIES, alias="default"), before)
+
+    async def test_async_cache_reads_are_counted(self):
+        cache = caches["default"]
+        hits = self.sample(CACHE_REQUESTS, cache="default", result="hit")
+        misses = self.sample(CACHE_REQUESTS, cache="default", result="miss")
+        await cache.aset("metrics-test", 1)
+        self.addCleanup(cache.delete, "metrics-test")
+        self.assertEqual(await cache.aget("metrics-test"), 1)
+        self.assertIsNone(await cache.aget("metrics-test-missing"))
+        await cache.aget_many(["metrics-test", "metrics-test-missing"])
+        self.assertEqual(
+            self.sample(CACHE_REQUESTS, cache="default", result="hit"), hits + 2
+        )
+        self.assertEqual(
+            self.sample(CACHE_REQUESTS, cache="default", result="miss"), misses + 2
+        )
+
+    @override_settings(METRICS_ALLOWED_IPS=["10.0.0.0/8"])
+    def test_metrics_are_restricted(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.get(url, REMOTE_ADDR="10.1.2.3")
+        self.assertContains(response, "# TYPE divvywonga_http_requests_total counter")
+
+        staff = User.objects.create_user("root", password="pw", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class ProfilingTests(TestCase):
+    """On-demand profiling by ProfilingMiddleware, also under ASGI."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(PROFILE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    async def test_staff_request_is_profiled(self):
+        staff = await User.objects.acreate_user("root", password="pw", is_staff=True)
+        await self.async_client.aforce_login(staff)
+        await self.async_client.get("/", {"profile": "1"})
+        self.assertEqual(
+            [(profile["view"], profile["user"]) for profile in recent_profiles()],
+            [("Index", "root")],
+        )
+
+    async def test_other_requests_are_not_profiled(self):
+        user = await User.objects.acreate_user("alice", password="pw")
+        await self.async_client.aforce_login(user)
+        await self.async_client.get("/", {"profile": "1"})
+        self.assertEqual(recent_profiles(), [])
@@ -1,7 +1,65 @@
+from ipaddress import ip_address, ip_network
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
 from django.shortcuts import render
 from django.views import View
+from core.metrics import render_metrics
+from core.profiling import profile_path, recent_profiles
 
 
 class Index(View):
     def get(self, request):
         return render(request, "core/index.html")
+
+
+class StaffRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
+    def test_func(self):
+        return self.request.user.is_staff
+
+
+class ProfileListView(StaffRequiredMixin, View):
+    """View for listing recent request profiles and their hotspots."""
+
+    def get(self, request):
+        context = {
+            "profiles": recent_profiles(),
+            "query_param": settings.PROFILE_QUERY_PARAM,
+        }
+        return render(request, "core/profiles.html", context)
+
+
+class ProfileDownloadView(StaffRequiredMixin, View):
+    """View for downloading a profile's pstats dump."""
+
+    def get(self, request, name):
+        path = profile_path(name)
+        if path is None:
+            raise Http404("No such profile.")
+        return FileResponse(path.open("rb"), as_attachment=True, filename=path.name)
+
+
+def metrics_allowed(request):
+    """Whether the client may read the metrics: staff or METRICS_ALLOWED_IPS."""
+    if request.user.is_staff:
+        return True
+    try:
+        address = ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(
+        address in ip_network(network, strict=False)
+        for network in settings.METRICS_ALLOWED_IPS
+    )
+
+
+class MetricsView(View):
+    """View exposing the metrics in the Prometheus text format."""
+
+    def get(self, request):
+        if not metrics_allowed(request):
+            return HttpResponseForbidden()
+        return HttpResponse(
+            render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
@@ -2,6 +2,9 @@
 ASGI config for divvywonga project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Live group updates (Server-Sent Events) need to be served through this
+entry point, e.g. ``gunicorn -k uvicorn.workers.UvicornWorker``, since
+the WSGI handler would tie up a worker per open stream.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -11,6 +14,6 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "divvywonga.settings")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
 
 application = get_asgi_application()
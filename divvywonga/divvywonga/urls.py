@@ -18,11 +18,51 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from django.urls import include
-from core.views import Index
+from django.utils.module_loading import import_string
+from core.views import Index, MetricsView, ProfileDownloadView, ProfileListView
+
+# Admin modules are discovered here rather than at startup, see core.apps
+admin.autodiscover()
+
+
+def tinymce_view(name):
+    """
+    A view calling django-tinymce's view `name`, which is imported on the
+    first request for it. Including tinymce.urls would import the views
+    when any URL is first reversed or resolved.
+    """
+
+    def view(request, *args, **kwargs):
+        return import_string(f"tinymce.views.{name}")(request, *args, **kwargs)
+
+    return view
+
 
 urlpatterns = [
     path("", Index.as_view(), name="index"),
     path("admin/", admin.site.urls),
+    path("metrics", MetricsView.as_view(), name="metrics"),
     path("users/", include("users.urls")),
-    path("tinymce/", include("tinymce.urls")),
+    path("staff/profiles/", ProfileListView.as_view(), name="profiles"),
+    path(
+        "staff/profiles/<str:name>.prof",
+        ProfileDownloadView.as_view(),
+        name="profile_download",
+    ),
+    # The URLs of tinymce.urls
+    path(
+        "tinymce/flatpages_link_list/",
+        tinymce_view("flatpages_link_list"),
+        name="tinymce-linklist",
+    ),
+    path(
+        "tinymce/compressor/",
+        tinymce_view("compressor"),
+        name="tinymce-compressor",
+    ),
+    path(
+        "tinymce/filebrowser/",
+        tinymce_view("filebrowser"),
+        name="tinymce-filebrowser",
+    ),
 ]
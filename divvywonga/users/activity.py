@@ -0,0 +1,178 @@
+import json
+from collections import defaultdict
+
+from django.db import transaction
+from core.pubsub import get_broker
+from users.models import (
+    Activity,
+    GroupFeedEntry,
+    GroupShard,
+    Membership,
+    UserFeedEntry,
+)
+
+FEED_PAGE_SIZE = 25
+FANOUT_BATCH_SIZE = 500
+
+
+def make_activity(verb, group, actor=None, target=None, **data):
+    """Build an unsaved Activity for the given group."""
+    return Activity(
+        verb=verb,
+        group=group,
+        group_name=group.name,
+        actor=actor,
+        target=target,
+        data=data,
+    )
+
+
+def departure_activity(verb, membership, actor=None):
+    """
+    Build the LEFT or REMOVED activity for a membership that is being deleted.
+    It records the points the member takes along, which users.rollups
+    subtracts from the group's balance.
+    """
+    return make_activity(
+        verb, membership.group, actor, membership.user, points=membership.points
+    )
+
+
+def membership_activities(old, new, actor=None):
+    """
+    Build the activities describing the change from `old` to `new`.
+    `old` is the membership as stored before the save (or None when created).
+    """
+    activities = []
+    if old is None:
+        verb = (
+            Activity.JOINED if actor is None or actor == new.user else Activity.INVITED
+        )
+        activities.append(
+            make_activity(verb, new.group, actor, new.user, role=new.role)
+        )
+    else:
+        if old.role != new.role:
+            activities.append(
+                make_activity(
+                    Activity.ROLE_CHANGED,
+                    new.group,
+                    actor,
+                    new.user,
+                    old_role=old.role,
+                    new_role=new.role,
+                )
+            )
+        if old.is_active != new.is_active:
+            verb = Activity.REACTIVATED if new.is_active else Activity.DEACTIVATED
+            activities.append(make_activity(verb, new.group, actor, new.user))
+
+    # Every points change is recorded, it also feeds the rollups in users.rollups
+    old_points = old.points if old is not None else 0
+    if old_points != new.points:
+        activities.append(
+            make_activity(
+                Activity.POINTS_AWARDED,
+                new.group,
+                actor,
+                new.user,
+                delta=new.points - old_points,
+                points=new.points,
+            )
+        )
+    return activities
+
+
+def record_activities(activities):
+    """
+    Write the activities in bulk and fan them out to the feeds of every
+    active group member (plus the actor and target) and to the group feed.
+
+    Group-level events such as deletions must be recorded before the
+    memberships they fan out to are removed.
+    """
+    if not activities:
+        return []
+
+    with transaction.atomic():
+        activities = Activity.objects.bulk_create(activities)
+
+        group_ids = {activity.group_id for activity in activities if activity.group_id}
+        members = defaultdict(set)
+        for alias, shard_group_ids in GroupShard.objects.shards_for(group_ids).items():
+            for user_id, group_id in (
+                Membership.objects.using(alias)
+                .filter(group_id__in=shard_group_ids, is_active=True)
+                .values_list("user_id", "group_id")
+            ):
+                members[group_id].add(user_id)
+
+        user_entries = []
+        group_entries = []
+        for activity in activities:
+            recipients = set(members.get(activity.group_id, ()))
+            recipients.update(
+                user_id
+                for user_id in (activity.actor_id, activity.target_id)
+                if user_id
+            )
+            user_entries.extend(
+                UserFeedEntry(user_id=user_id, activity=activity)
+                for user_id in recipients
+            )
+            if activity.group_id:
+                group_entries.append(
+                    GroupFeedEntry(group_id=activity.group_id, activity=activity)
+                )
+
+        UserFeedEntry.objects.bulk_create(user_entries, batch_size=FANOUT_BATCH_SIZE)
+        GroupFeedEntry.objects.bulk_create(group_entries, batch_size=FANOUT_BATCH_SIZE)
+
+        transaction.on_commit(lambda: publish_activities(activities))
+
+    return activities
+
+
+def activity_diff(activity):
+    """Compact description of a membership change for live group updates."""
+    diff = {"verb": activity.verb, **activity.data}
+    if activity.target_id:
+        diff["user_id"] = activity.target_id
+        diff["username"] = activity.target.username
+    return diff
+
+
+def publish_activities(activities):
+    """Push one message per group with the diffs of its new activities."""
+    diffs = defaultdict(list)
+    for activity in activities:
+        if activity.group_id:
+            diffs[activity.group_id].append(activity_diff(activity))
+
+    broker = get_broker()
+    for group_id, events in diffs.items():
+        broker.publish(group_channel(group_id), json.dumps({"events": events}))
+
+
+def group_channel(group_id):
+    return f"group:{group_id}"
+
+
+def paginate_feed(entries, cursor=None, page_size=FEED_PAGE_SIZE):
+    """
+    Return one page of feed entries, newest first, and the cursor for the next page.
+
+    `entries` is a UserFeedEntry or GroupFeedEntry queryset already filtered to
+    one user or group; the cursor is the id of the last activity seen, so each
+    page is a single range scan over the (owner, activity) index.
+    """
+    if cursor:
+        entries = entries.filter(activity_id__lt=cursor)
+
+    page = list(
+        entries.select_related("activity__actor", "activity__target").order_by(
+            "-activity_id"
+        )[: page_size + 1]
+    )
+    next_cursor = page[page_size - 1].activity_id if len(page) > page_size else None
+    return [entry.activity for entry in page[:page_size]], next_cursor
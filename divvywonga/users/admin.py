@@ -1,5 +1,114 @@
-from django.contrib import admin
-from users.models import Group, Membership
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponseRedirect, QueryDict
+from users.activity import (
+    departure_activity,
+    make_activity,
+    membership_activities,
+    record_activities,
+)
+from users.members import (
+    MAX_POINTS,
+    MEMBER_ACTIONS,
+    admin_groups,
+    apply_member_action,
+    ensure_groups_have_admin,
+    last_admins,
+)
+from users.models import (
+    Activity,
+    Group,
+    GroupLocked,
+    GroupPointsRollup,
+    GroupShard,
+    Membership,
+    MembershipPointsRollup,
+)
+from users.rollups import points_charts
+from users.sharding import shard_alias, use_shard
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """Pick which shard database the changelist shows."""
+
+    title = "shard"
+    parameter_name = "shard"
+
+    def lookups(self, request, model_admin):
+        return [
+            (str(shard), f"Shard {shard}") for shard in range(settings.DATABASE_SHARDS)
+        ]
+
+    def queryset(self, request, queryset):
+        # The shard is applied by ShardedAdminMixin.get_queryset
+        return queryset
+
+
+class ShardedAdminMixin:
+    """
+    Serve admin views for sharded models from one shard at a time, chosen
+    with ShardListFilter and kept through the changelist filters that the
+    admin preserves on change, add and delete pages.
+    """
+
+    def get_shard(self, request):
+        shard = request.GET.get("shard")
+        if shard is None:
+            shard = QueryDict(request.GET.get("_changelist_filters", "")).get("shard")
+        if shard and shard.isdigit() and int(shard) < settings.DATABASE_SHARDS:
+            return shard_alias(int(shard))
+        return "default"
+
+    def get_queryset(self, request):
+        # Pin the database since changelist results are only read while rendering
+        return super().get_queryset(request).using(self.get_shard(request))
+
+    def shard_view(self, request, view, *args):
+        """
+        Run an admin view on the selected shard. Posted changes are made in
+        one transaction there, and refused while a group on the shard is
+        being moved (see GroupShardManager.ensure_unlocked) or when a save
+        raises ValidationError, e.g. for leaving a group without an admin.
+        """
+        alias = self.get_shard(request)
+        with use_shard(alias):
+            if request.method != "POST":
+                return view(*args)
+            try:
+                with transaction.atomic(using=alias):
+                    GroupShard.objects.ensure_unlocked(alias)
+                    return view(*args)
+            except ValidationError as e:
+                self.message_user(request, " ".join(e.messages), messages.ERROR)
+                return HttpResponseRedirect(request.get_full_path())
+
+    def changelist_view(self, request, extra_context=None):
+        return self.shard_view(request, super().changelist_view, request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url="", extra_context=None):
+        return self.shard_view(
+            request,
+            super().changeform_view,
+            request,
+            object_id,
+            form_url,
+            extra_context,
+        )
+
+    def delete_view(self, request, object_id, extra_context=None):
+        return self.shard_view(
+            request, super().delete_view, request, object_id, extra_context
+        )
+
+    def history_view(self, request, object_id, extra_context=None):
+        with use_shard(self.get_shard(request)):
+            return super().history_view(request, object_id, extra_context)
 
 
 class MembershipInline(admin.TabularInline):
@@ -12,11 +121,11 @@ class MembershipInline(admin.TabularInline):
 
 
 @admin.register(Group)
-class GroupAdmin(admin.ModelAdmin):
+class GroupAdmin(ShardedAdminMixin, admin.ModelAdmin):
     """Admin configuration for Group model."""
 
     list_display = ("name", "is_active", "member_count", "total_points", "created_at")
-    list_filter = ("is_active", "created_at")
+    list_filter = (ShardListFilter, "is_active", "created_at")
     search_fields = ("name", "description")
     readonly_fields = ("created_at", "updated_at")
     inlines = [MembershipInline]
@@ -33,18 +142,232 @@ class GroupAdmin(admin.ModelAdmin):
 
     total_points.short_description = "Total Points"
 
+    def get_shard(self, request):
+        """Groups are looked up in the shard map, whatever filter is preserved."""
+        object_id = request.resolver_match.kwargs.get("object_id", "")
+        if object_id.isdigit():
+            return GroupShard.objects.shard_for(int(object_id))
+        return super().get_shard(request)
+
+    def render_change_form(
+        self, request, context, add=False, change=False, form_url="", obj=None
+    ):
+        """Show the group's points trend below the form."""
+        if obj is not None:
+            context["points_charts"] = points_charts(
+                GroupPointsRollup.objects.filter(group_id=obj.pk)
+            )
+        return super().render_change_form(request, context, add, change, form_url, obj)
+
+    def save_formset(self, request, form, formset, change):
+        """Record activity for memberships edited through the inline."""
+        if formset.model is not Membership:
+            return super().save_formset(request, form, formset, change)
+
+        changed = [
+            f.instance for f in formset.forms if f.has_changed() and f.instance.pk
+        ]
+        deleted = [f.instance for f in formset.deleted_forms if f.instance.pk]
+        old = Membership.objects.in_bulk([m.pk for m in changed + deleted])
+        activities = [
+            departure_activity(Activity.LEFT, old[obj.pk], request.user)
+            for obj in deleted
+        ]
+        with transaction.atomic():
+            # Record removals before the memberships go away
+            record_activities(activities)
+            super().save_formset(request, form, formset, change)
+            # Raising rolls the save back, see ShardedAdminMixin.shard_view
+            ensure_groups_have_admin(
+                admin_groups(old.values()), form.instance._state.db
+            )
+            activities = []
+            for membership in formset.new_objects + changed:
+                if membership in deleted:
+                    continue
+                activities.extend(
+                    membership_activities(
+                        old.get(membership.pk), membership, actor=request.user
+                    )
+                )
+            record_activities(activities)
+
+    def delete_model(self, request, obj):
+        """Record a deletion event before deleting the group."""
+        with transaction.atomic():
+            record_activities([make_activity(Activity.DELETED, obj, request.user)])
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        """Record deletion events in bulk before deleting the groups."""
+        with transaction.atomic():
+            record_activities(
+                [
+                    make_activity(Activity.DELETED, group, request.user)
+                    for group in queryset
+                ]
+            )
+            super().delete_queryset(request, queryset)
+
+
+class MembershipActionForm(ActionForm):
+    """Action form with the number of points for the adjust points action."""
+
+    points = forms.IntegerField(
+        required=False, min_value=-MAX_POINTS, max_value=MAX_POINTS
+    )
+
 
 @admin.register(Membership)
-class MembershipAdmin(admin.ModelAdmin):
+class MembershipAdmin(ShardedAdminMixin, admin.ModelAdmin):
     """Admin configuration for Membership model."""
 
     list_display = ("user", "group", "points", "role", "is_active", "joined_at")
-    list_filter = ("role", "is_active", "joined_at", "group")
-    search_fields = ("user__username", "user__email", "group__name")
+    list_filter = (ShardListFilter, "role", "is_active", "joined_at", "group")
+    # Users live in the default database, so they can't be joined or searched
+    # in a shard query; see get_search_results
+    list_select_related = ("group",)
+    search_fields = ("group__name",)
     readonly_fields = ("joined_at",)
+    actions = (
+        "make_moderator",
+        "remove_moderator",
+        "activate",
+        "deactivate",
+        "adjust_points",
+        "remove",
+    )
+    action_form = MembershipActionForm
 
     fieldsets = (
         ("Relationship", {"fields": ("user", "group")}),
         ("Membership Details", {"fields": ("points", "role", "is_active")}),
         ("Timestamps", {"fields": ("joined_at",), "classes": ("collapse",)}),
     )
+
+    def _apply_action(self, request, queryset, action, points=0):
+        try:
+            count = apply_member_action(queryset, action, request.user, points)
+        except ValidationError as e:
+            self.message_user(request, e.message, messages.ERROR)
+        else:
+            label = dict(MEMBER_ACTIONS)[action]
+            self.message_user(request, f"{label}: updated {count} membership(s).")
+
+    @admin.action(description="Make selected members moderators")
+    def make_moderator(self, request, queryset):
+        self._apply_action(request, queryset, "make_moderator")
+
+    @admin.action(description="Remove selected members as moderators")
+    def remove_moderator(self, request, queryset):
+        self._apply_action(request, queryset, "remove_moderator")
+
+    @admin.action(description="Activate selected memberships")
+    def activate(self, request, queryset):
+        self._apply_action(request, queryset, "activate")
+
+    @admin.action(description="Deactivate selected memberships")
+    def deactivate(self, request, queryset):
+        self._apply_action(request, queryset, "deactivate")
+
+    @admin.action(description="Adjust points of selected members")
+    def adjust_points(self, request, queryset):
+        # The action form has already validated the field
+        points = request.POST.get("points")
+        if not points:
+            self.message_user(
+                request,
+                "Enter the number of points to add or subtract.",
+                messages.ERROR,
+            )
+            return
+        self._apply_action(request, queryset, "adjust_points", int(points))
+
+    @admin.action(description="Remove selected members from their groups")
+    def remove(self, request, queryset):
+        self._apply_action(request, queryset, "remove")
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == "group":
+            kwargs["queryset"] = Group.objects.using(self.get_shard(request))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Also match memberships by the username or email of their user."""
+        results, may_have_duplicates = super().get_search_results(
+            request, queryset, search_term
+        )
+        if search_term:
+            user_ids = User.objects.filter(
+                Q(username__icontains=search_term) | Q(email__icontains=search_term)
+            ).values_list("pk", flat=True)
+            results |= queryset.filter(user_id__in=list(user_ids))
+        return results, may_have_duplicates
+
+    def render_change_form(
+        self, request, context, add=False, change=False, form_url="", obj=None
+    ):
+        """Show the member's points trend below the form."""
+        if obj is not None:
+            context["points_charts"] = points_charts(
+                MembershipPointsRollup.objects.filter(
+                    group_id=obj.group_id, user_id=obj.user_id
+                )
+            )
+        return super().render_change_form(request, context, add, change, form_url, obj)
+
+    def save_model(self, request, obj, form, change):
+        """Record joins, role changes and point awards made in the admin."""
+        old = Membership.objects.filter(pk=obj.pk).first() if change else None
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            # Raising rolls the save back, see ShardedAdminMixin.shard_view
+            ensure_groups_have_admin(admin_groups([old]), obj._state.db)
+            record_activities(membership_activities(old, obj, actor=request.user))
+
+    def get_deleted_objects(self, objs, request):
+        """Refuse to delete the last admin of a group, like a protected object."""
+        deleted_objects, model_count, perms_needed, protected = (
+            super().get_deleted_objects(objs, request)
+        )
+        memberships = Membership.objects.using(self.get_shard(request)).filter(
+            pk__in=[obj.pk for obj in objs]
+        )
+        protected = list(protected) + [
+            f"{membership} (the last admin of {membership.group})"
+            for membership in last_admins(memberships)
+        ]
+        return deleted_objects, model_count, perms_needed, protected
+
+    def delete_model(self, request, obj):
+        """Remove the membership like the remove action does."""
+        apply_member_action(
+            Membership.objects.using(obj._state.db).filter(pk=obj.pk),
+            "remove",
+            request.user,
+        )
+
+    def delete_queryset(self, request, queryset):
+        """Remove the memberships like the remove action does."""
+        apply_member_action(queryset, "remove", request.user)
+
+
+@admin.register(Activity)
+class ActivityAdmin(admin.ModelAdmin):
+    """Admin configuration for Activity model."""
+
+    list_display = ("verb", "group_name", "actor", "target", "created_at")
+    list_filter = ("verb", "created_at")
+    search_fields = ("group_name", "actor__username", "target__username")
+    readonly_fields = (
+        "verb",
+        "group",
+        "group_name",
+        "actor",
+        "target",
+        "data",
+        "created_at",
+    )
+
+    def has_add_permission(self, request):
+        return False
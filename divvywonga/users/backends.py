@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def invalidate_cached_user(user_id):
+    """Drop the cached user so the next request reloads it from the database."""
+    caches[settings.AUTH_USER_CACHE_ALIAS].delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that caches the user loaded by AuthenticationMiddleware,
+    so authenticated requests don't read auth_user before the view runs.
+    Entries are dropped whenever the user is saved or deleted.
+    """
+
+    def get_user(self, user_id):
+        cache = caches[settings.AUTH_USER_CACHE_ALIAS]
+        key = user_cache_key(user_id)
+
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+
+        return user
+
+    async def aget_user(self, user_id):
+        cache = caches[settings.AUTH_USER_CACHE_ALIAS]
+        key = user_cache_key(user_id)
+
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await cache.aset(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+
+        return user
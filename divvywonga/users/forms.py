@@ -3,7 +3,9 @@ from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from django import forms
 from django.core.exceptions import ValidationError
+from users.members import MAX_POINTS, MEMBER_ACTIONS
 from users.models import Group, Membership
+from users.sharding import shard_aliases
 
 
 class UserRegisterForm(UserCreationForm):
@@ -59,6 +61,16 @@ class GroupCreateForm(forms.ModelForm):
                 help_text="Enter email addresses of users to invite (comma-separated)",
             )
 
+    def clean_name(self):
+        name = self.cleaned_data["name"]
+
+        # The unique constraint only covers a single shard, so check them all
+        for alias in shard_aliases():
+            if Group.objects.using(alias).filter(name=name).exists():
+                raise ValidationError("Group with this Name already exists.")
+
+        return name
+
     class Meta:
         model = Group
         fields = ["name", "description"]
@@ -122,3 +134,40 @@ class GroupInviteForm(forms.Form):
                 raise ValidationError(f'"{email}" is not a valid email address')
 
         return emails
+
+
+class BulkMembershipForm(forms.Form):
+    """Form for applying one action to many members of a group."""
+
+    action = forms.ChoiceField(
+        choices=MEMBER_ACTIONS,
+        widget=forms.Select(attrs={"class": "form-select form-select-sm"}),
+    )
+    memberships = forms.ModelMultipleChoiceField(
+        queryset=Membership.objects.none(),
+        error_messages={"required": "Select at least one member."},
+    )
+    points = forms.IntegerField(
+        required=False,
+        min_value=-MAX_POINTS,
+        max_value=MAX_POINTS,
+        widget=forms.NumberInput(
+            attrs={
+                "class": "form-control form-control-sm",
+                "placeholder": "± points",
+                "style": "width: 7rem;",
+            }
+        ),
+    )
+
+    def __init__(self, *args, group=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["memberships"].queryset = Membership.objects.filter(group=group)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get("action") == "adjust_points" and not cleaned_data.get(
+            "points"
+        ):
+            raise ValidationError("Enter the number of points to add or subtract.")
+        return cleaned_data
@@ -0,0 +1,24 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from users.snapshots import SnapshotError, export_group
+
+
+class Command(BaseCommand):
+    help = (
+        "Write a compressed snapshot of a group, its memberships and its "
+        "activities, for import_group."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("group_id", type=int)
+        parser.add_argument("path", help="Snapshot file to write, e.g. group.jsonl.gz")
+
+    def handle(self, *args, group_id, path, **options):
+        try:
+            with open(path, "wb") as file:
+                count = export_group(group_id, file)
+        except SnapshotError as e:
+            Path(path).unlink(missing_ok=True)
+            raise CommandError(e) from e
+        self.stdout.write(f"Wrote {count} records to {path}.")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.snapshots import SnapshotError, import_group
+
+
+class Command(BaseCommand):
+    help = (
+        "Create a group from a snapshot written by export_group. The group gets "
+        "a new id; run rollup_points afterwards to chart its history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Snapshot file to read")
+        parser.add_argument("--name", help="Name for the group instead of the original")
+        parser.add_argument(
+            "--create-users",
+            action="store_true",
+            help="Create missing users (inactive, without a usable password)",
+        )
+
+    def handle(self, *args, path, name, create_users, **options):
+        try:
+            with open(path, "rb") as file:
+                group = import_group(file, name=name, create_users=create_users)
+        except (OSError, SnapshotError) as e:
+            raise CommandError(e) from e
+        self.stdout.write(f'Imported group "{group.name}" with id {group.pk}.')
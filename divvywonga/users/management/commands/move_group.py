@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, When
+from users.models import Group, GroupShard, Membership
+from users.sharding import shard_alias
+
+# Rows per statement, keeping the joined_at updates within SQLite's limit of
+# 999 bound parameters on older versions
+BATCH_SIZE = 250
+
+
+class Command(BaseCommand):
+    help = (
+        "Move a group and its memberships to another shard database. The group "
+        "stays readable during the move; writes to it are refused until it's done."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("group_id", type=int)
+        parser.add_argument("shard", type=int, help="Number of the target shard")
+
+    def handle(self, *args, group_id, shard, **options):
+        if not 0 <= shard < settings.DATABASE_SHARDS:
+            raise CommandError(
+                f"Shard must be between 0 and {settings.DATABASE_SHARDS - 1}."
+            )
+
+        entry = GroupShard.objects.filter(pk=group_id).first()
+        if entry is None:
+            raise CommandError(f"Group {group_id} does not exist.")
+
+        source, target = entry.alias, shard_alias(shard)
+        if source == target:
+            self.stdout.write(f"Group {group_id} is already on shard {shard}.")
+            return
+
+        shard_map = GroupShard.objects.filter(pk=group_id)
+        # Lock only an unlocked entry still on the source, so two moves of a
+        # group can't overlap
+        if not shard_map.filter(shard=entry.shard, is_locked=False).update(
+            is_locked=True
+        ):
+            raise CommandError(f"Group {group_id} is already being moved.")
+        try:
+            # Read the group in one transaction for a consistent snapshot.
+            # Holding the source's write lock first waits for the writes that
+            # started before the lock was set; later ones see it and back off.
+            with transaction.atomic(using=source):
+                GroupShard.objects.hold_writes(source)
+                group = Group.objects.using(source).filter(pk=group_id).first()
+                if group is None:
+                    raise CommandError(f"Group {group_id} was deleted.")
+                memberships = list(
+                    Membership.objects.using(source).filter(group_id=group_id)
+                )
+
+            with transaction.atomic(using=target):
+                created_at, updated_at = group.created_at, group.updated_at
+                group.save(using=target, force_insert=True)
+
+                # Membership ids are only unique within a shard
+                joined_at = [(m.user_id, m.joined_at) for m in memberships]
+                for membership in memberships:
+                    membership.pk = None
+                Membership.objects.using(target).bulk_create(
+                    memberships, batch_size=BATCH_SIZE
+                )
+
+                # Saving stamps new creation times; restore the original ones
+                Group.objects.using(target).filter(pk=group_id).update(
+                    created_at=created_at, updated_at=updated_at
+                )
+                for start in range(0, len(joined_at), BATCH_SIZE):
+                    batch = joined_at[start : start + BATCH_SIZE]
+                    Membership.objects.using(target).filter(
+                        group_id=group_id, user_id__in=[user_id for user_id, _ in batch]
+                    ).update(
+                        joined_at=Case(
+                            *(
+                                When(user_id=user_id, then=timestamp)
+                                for user_id, timestamp in batch
+                            )
+                        )
+                    )
+
+            # Switch reads and writes over, then drop the old copy
+            shard_map.update(shard=shard)
+            Group.objects.using(source).filter(pk=group_id).delete()
+        finally:
+            shard_map.update(is_locked=False)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Moved group {group_id} with {len(memberships)} membership(s) "
+                f"from {source} to {target}."
+            )
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from users.rollups import ROLLUP_BATCH_SIZE, update_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold the points changes recorded since the last run into the daily and "
+        "weekly points rollups. Safe to run repeatedly, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=ROLLUP_BATCH_SIZE,
+            help="Number of changes processed per transaction",
+        )
+
+    def handle(self, *args, batch_size, **options):
+        processed = update_rollups(batch_size)
+        self.stdout.write(f"Processed {processed} points change(s).")
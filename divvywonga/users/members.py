@@ -0,0 +1,142 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest, Least
+from users.activity import departure_activity, make_activity, record_activities
+from users.models import Activity, GroupShard, Membership
+
+MAX_POINTS = 10000
+
+MEMBER_ACTIONS = [
+    ("make_moderator", "Make Moderator"),
+    ("remove_moderator", "Remove as Moderator"),
+    ("activate", "Activate"),
+    ("deactivate", "Deactivate"),
+    ("adjust_points", "Adjust Points"),
+    ("remove", "Remove from Group"),
+]
+
+# Actions that change roles are reserved for group admins
+ROLE_ACTIONS = ("make_moderator", "remove_moderator")
+
+
+def admin_groups(memberships):
+    """
+    Ids of the groups in which any of the memberships (None is skipped) is
+    an active admin: the only groups whose admins a change to them can take.
+    """
+    return {m.group_id for m in memberships if m and m.role == "admin" and m.is_active}
+
+
+def ensure_groups_have_admin(group_ids, using):
+    """Raise ValidationError if any of the groups has no active admin left."""
+    if not group_ids:
+        return
+    with_admin = set(
+        Membership.objects.using(using)
+        .filter(group_id__in=group_ids, role="admin", is_active=True)
+        .values_list("group_id", flat=True)
+    )
+    if set(group_ids) - with_admin:
+        raise ValidationError(
+            "A group must keep at least one admin. Please assign another admin first."
+        )
+
+
+def last_admins(memberships):
+    """
+    The memberships in the queryset whose removal would leave their group
+    without an active admin, to refuse such removals up front.
+    """
+    selected = list(memberships.select_related("group"))
+    admins = [m for m in selected if m.role == "admin" and m.is_active]
+    remaining = set(
+        Membership.objects.using(memberships.db)
+        .filter(group_id__in={m.group_id for m in admins}, role="admin", is_active=True)
+        .exclude(pk__in=[m.pk for m in selected])
+        .values_list("group_id", flat=True)
+    )
+    return [m for m in admins if m.group_id not in remaining]
+
+
+def apply_member_action(memberships, action, actor, points=0):
+    """
+    Apply `action` to every membership in the queryset with one set-based
+    UPDATE or DELETE and record the resulting activities.
+
+    The last-admin check runs in the same transaction, so if any group would
+    be left without an active admin nothing is changed and ValidationError
+    is raised, as it is (GroupLocked) when a group is being moved. Returns
+    the number of memberships affected.
+    """
+    using = memberships.db
+    with transaction.atomic(using=using):
+        before = list(memberships.select_related("group").prefetch_related("user"))
+        if not before:
+            return 0
+        GroupShard.objects.ensure_unlocked(using, {m.group_id for m in before})
+
+        targets = Membership.objects.using(using).filter(
+            pk__in=[membership.pk for membership in before]
+        )
+        activities = []
+
+        if action == "make_moderator":
+            affected = targets.filter(role="member").update(role="moderator")
+            activities = _role_activities(before, "member", "moderator", actor)
+        elif action == "remove_moderator":
+            affected = targets.filter(role="moderator").update(role="member")
+            activities = _role_activities(before, "moderator", "member", actor)
+        elif action in ("activate", "deactivate"):
+            is_active = action == "activate"
+            affected = targets.exclude(is_active=is_active).update(is_active=is_active)
+            verb = Activity.REACTIVATED if is_active else Activity.DEACTIVATED
+            activities = [
+                make_activity(verb, m.group, actor, m.user)
+                for m in before
+                if m.is_active != is_active
+            ]
+        elif action == "adjust_points":
+            affected = targets.update(
+                points=Least(Greatest(F("points") + points, 0), MAX_POINTS)
+            )
+            for m in before:
+                new_points = min(max(m.points + points, 0), MAX_POINTS)
+                if new_points != m.points:
+                    activities.append(
+                        make_activity(
+                            Activity.POINTS_AWARDED,
+                            m.group,
+                            actor,
+                            m.user,
+                            delta=new_points - m.points,
+                            points=new_points,
+                        )
+                    )
+        elif action == "remove":
+            affected, _ = targets.delete()
+            activities = [
+                departure_activity(Activity.REMOVED, m, actor) for m in before
+            ]
+        else:
+            raise ValueError(f"Unknown member action: {action}")
+
+        ensure_groups_have_admin(admin_groups(before), using)
+        record_activities(activities)
+
+    return affected
+
+
+def _role_activities(before, old_role, new_role, actor):
+    return [
+        make_activity(
+            Activity.ROLE_CHANGED,
+            m.group,
+            actor,
+            m.user,
+            old_role=old_role,
+            new_role=new_role,
+        )
+        for m in before
+        if m.role == old_role
+    ]
@@ -0,0 +1,74 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.contrib import messages
+from django.shortcuts import redirect
+from users.models import GroupLocked, GroupShard
+from users.sharding import select_shard, shard_alias, use_shard
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ShardMiddleware:
+    """
+    Select the shard of the group named by a view's `group_id` argument, so
+    the group views can query groups and memberships without routing them.
+    Writes to a group that is being moved between shards are refused up
+    front; the views check again once they hold the shard's write lock (see
+    GroupShardManager.ensure_unlocked).
+
+    Under ASGI the shard map is read with the async ORM, so requests don't
+    switch to a thread for it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django awaits a coroutine process_view in the request's task
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with use_shard(None):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with use_shard(None):
+            return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        group_id = view_kwargs.get("group_id")
+        if group_id is None:
+            return None
+        entry = (
+            GroupShard.objects.filter(pk=group_id)
+            .values_list("shard", "is_locked")
+            .first()
+        )
+        return self._select_shard(request, group_id, entry)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        group_id = view_kwargs.get("group_id")
+        if group_id is None:
+            return None
+        entry = (
+            await GroupShard.objects.filter(pk=group_id)
+            .values_list("shard", "is_locked")
+            .afirst()
+        )
+        return self._select_shard(request, group_id, entry)
+
+    def _select_shard(self, request, group_id, entry):
+        shard, is_locked = entry or (0, False)
+
+        if is_locked and request.method not in SAFE_METHODS:
+            messages.error(request, GroupLocked().message)
+            return redirect("group_detail", group_id=group_id)
+
+        # Stays selected until __call__ resets it at the end of the request
+        select_shard(shard_alias(shard))
+        return None
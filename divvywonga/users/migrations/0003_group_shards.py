@@ -0,0 +1,80 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_group_shards(apps, schema_editor):
+    """Pin existing groups, which all live in the default database, to shard 0."""
+    db_alias = schema_editor.connection.alias
+    Group = apps.get_model("users", "Group")
+    GroupShard = apps.get_model("users", "GroupShard")
+    GroupShard.objects.using(db_alias).bulk_create(
+        GroupShard(pk=group_id, shard=0)
+        for group_id in Group.objects.using(db_alias).values_list("pk", flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0002_activity_feed"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GroupShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("shard", models.PositiveSmallIntegerField(default=0)),
+                ("is_locked", models.BooleanField(default=False)),
+            ],
+            options={
+                "verbose_name": "Group Shard",
+                "verbose_name_plural": "Group Shards",
+            },
+        ),
+        migrations.RunPython(
+            backfill_group_shards,
+            migrations.RunPython.noop,
+            hints={"model_name": "groupshard"},
+        ),
+        migrations.AlterField(
+            model_name="activity",
+            name="group",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                to="users.group",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="groupfeedentry",
+            name="group",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                to="users.group",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="membership",
+            name="user",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0003_group_shards"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="activity",
+            name="verb",
+            field=models.CharField(
+                choices=[
+                    ("joined", "Joined"),
+                    ("left", "Left"),
+                    ("invited", "Invited"),
+                    ("role_changed", "Role changed"),
+                    ("points_awarded", "Points awarded"),
+                    ("deactivated", "Deactivated"),
+                    ("reactivated", "Reactivated"),
+                    ("removed", "Removed"),
+                    ("deleted", "Deleted"),
+                ],
+                max_length=20,
+            ),
+        ),
+    ]
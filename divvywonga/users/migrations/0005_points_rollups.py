@@ -0,0 +1,119 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0004_member_actions"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("last_activity_id", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Rollup Watermark",
+                "verbose_name_plural": "Rollup Watermarks",
+            },
+        ),
+        migrations.CreateModel(
+            name="GroupPointsRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("day", "Day"), ("week", "Week")], max_length=4
+                    ),
+                ),
+                ("period_start", models.DateField()),
+                ("delta", models.IntegerField(default=0)),
+                ("points", models.IntegerField(default=0)),
+                (
+                    "group",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        to="users.group",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Group Points Rollup",
+                "verbose_name_plural": "Group Points Rollups",
+                "ordering": ["period_start"],
+                "abstract": False,
+                "unique_together": {("group", "period", "period_start")},
+            },
+        ),
+        migrations.CreateModel(
+            name="MembershipPointsRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("day", "Day"), ("week", "Week")], max_length=4
+                    ),
+                ),
+                ("period_start", models.DateField()),
+                ("delta", models.IntegerField(default=0)),
+                ("points", models.IntegerField(default=0)),
+                (
+                    "group",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        to="users.group",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Membership Points Rollup",
+                "verbose_name_plural": "Membership Points Rollups",
+                "ordering": ["period_start"],
+                "abstract": False,
+                "unique_together": {("group", "user", "period", "period_start")},
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, migrations
+from django.utils import timezone
+
+
+def seed_points_rollups(apps, schema_editor):
+    """
+    Start the rollups from the current membership points and skip the
+    activities recorded so far, which don't account for all of them.
+    """
+    Activity = apps.get_model("users", "Activity")
+    Membership = apps.get_model("users", "Membership")
+    MembershipPointsRollup = apps.get_model("users", "MembershipPointsRollup")
+    GroupPointsRollup = apps.get_model("users", "GroupPointsRollup")
+    RollupWatermark = apps.get_model("users", "RollupWatermark")
+
+    MembershipPointsRollup.objects.all().delete()
+    GroupPointsRollup.objects.all().delete()
+    last_activity_id = (
+        Activity.objects.order_by("-id").values_list("id", flat=True).first() or 0
+    )
+    RollupWatermark.objects.update_or_create(
+        name="points", defaults={"last_activity_id": last_activity_id}
+    )
+
+    today = timezone.localdate()
+    starts = {"day": today, "week": today - timedelta(days=today.weekday())}
+    for shard in range(settings.DATABASE_SHARDS):
+        alias = "default" if shard == 0 else f"shard_{shard}"
+        if (
+            Membership._meta.db_table
+            not in connections[alias].introspection.table_names()
+        ):
+            # A shard that hasn't been migrated yet has no memberships
+            continue
+
+        group_points = defaultdict(int)
+        member_rollups = []
+        for group_id, user_id, points in (
+            Membership.objects.using(alias)
+            .exclude(points=0)
+            .values_list("group_id", "user_id", "points")
+            .iterator()
+        ):
+            group_points[group_id] += points
+            member_rollups.extend(
+                MembershipPointsRollup(
+                    group_id=group_id,
+                    user_id=user_id,
+                    period=period,
+                    period_start=start,
+                    points=points,
+                )
+                for period, start in starts.items()
+            )
+        MembershipPointsRollup.objects.bulk_create(member_rollups, batch_size=1000)
+        GroupPointsRollup.objects.bulk_create(
+            [
+                GroupPointsRollup(
+                    group_id=group_id, period=period, period_start=start, points=points
+                )
+                for group_id, points in group_points.items()
+                for period, start in starts.items()
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0005_points_rollups"),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_points_rollups, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,11 @@
-from django.db import models
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
+from users.sharding import shard_alias, shard_aliases
 
 
 class Group(models.Model):
@@ -27,9 +32,36 @@ class Group(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # New groups get a globally unique id (and their shard) from the shard map
+        if self.pk is None:
+            entry = GroupShard.objects.allocate()
+            self.pk = entry.pk
+            kwargs["force_insert"] = True
+            # Also when called by objects.create(), which routed the insert
+            # before the group had an id
+            kwargs["using"] = entry.alias
+        super().save(*args, **kwargs)
+
+    def validate_unique(self, exclude=None):
+        """Check the name against the groups of every shard, not just one."""
+        super().validate_unique(exclude)
+        if exclude and "name" in exclude:
+            return
+        for alias in shard_aliases():
+            others = Group.objects.using(alias).filter(name=self.name)
+            if others.exclude(pk=self.pk).exists():
+                raise ValidationError(
+                    {"name": self.unique_error_message(Group, ("name",))}
+                )
+
     def get_active_members(self):
         """Get all active members of this group."""
-        return self.members.filter(membership__is_active=True)
+        # Users live in the default database, so resolve the ids separately
+        user_ids = self.membership_set.filter(is_active=True).values_list(
+            "user_id", flat=True
+        )
+        return User.objects.filter(pk__in=list(user_ids))
 
     def get_total_points(self):
         """Get total points for all members in this group."""
@@ -41,6 +73,24 @@ class Group(models.Model):
         )
 
 
+class MembershipQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        """
+        Create the membership in its group's shard. A plain create() routes
+        the insert without the new instance, by the shard selected for the
+        request, which outside requests (commands, shells, signal handlers)
+        is the default database.
+        """
+        if self._db is None:
+            hint = self.model(
+                **{k: kwargs[k] for k in ("group", "group_id") if k in kwargs}
+            )
+            return self.using(router.db_for_write(self.model, instance=hint)).create(
+                **kwargs
+            )
+        return super().create(**kwargs)
+
+
 class Membership(models.Model):
     """
     Auxiliary model for the many-to-many relationship between User and Group.
@@ -52,7 +102,8 @@ class Membership(models.Model):
         ("moderator", "Moderator"),
         ("member", "Member"),
     ]
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Users are stored in the default database, which may not be this group's shard
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
     group = models.ForeignKey(Group, on_delete=models.CASCADE)
 
     # Additional attributes for the relationship
@@ -67,6 +118,8 @@ class Membership(models.Model):
     is_active = models.BooleanField(default=True)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default="member")
 
+    objects = MembershipQuerySet.as_manager()
+
     class Meta:
         unique_together = ("user", "group")
         ordering = ["-joined_at"]
@@ -87,3 +140,246 @@ class Membership(models.Model):
     def can_moderate(self):
         """Check if user can moderate this group."""
         return self.role in ["admin", "moderator"]
+
+
+class Activity(models.Model):
+    """
+    A single event in a group's history (joins, leaves, role changes, ...).
+    Activities are written once and fanned out to per-user and per-group feeds.
+    """
+
+    JOINED = "joined"
+    LEFT = "left"
+    INVITED = "invited"
+    ROLE_CHANGED = "role_changed"
+    POINTS_AWARDED = "points_awarded"
+    DEACTIVATED = "deactivated"
+    REACTIVATED = "reactivated"
+    REMOVED = "removed"
+    DELETED = "deleted"
+
+    VERB_CHOICES = [
+        (JOINED, "Joined"),
+        (LEFT, "Left"),
+        (INVITED, "Invited"),
+        (ROLE_CHANGED, "Role changed"),
+        (POINTS_AWARDED, "Points awarded"),
+        (DEACTIVATED, "Deactivated"),
+        (REACTIVATED, "Reactivated"),
+        (REMOVED, "Removed"),
+        (DELETED, "Deleted"),
+    ]
+
+    verb = models.CharField(max_length=20, choices=VERB_CHOICES)
+    actor = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="activities_performed",
+    )
+    target = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="activities_received",
+    )
+    # Kept after the group is deleted so the "deleted" event still makes sense.
+    # Groups may live in another database, see users.signals for the cleanup.
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+    )
+    group_name = models.CharField(max_length=100)
+    data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-id"]
+        verbose_name = "Activity"
+        verbose_name_plural = "Activities"
+
+    def __str__(self):
+        return f"{self.get_verb_display()} in {self.group_name}"
+
+
+class UserFeedEntry(models.Model):
+    """
+    Fan-out row linking an activity to a user that should see it.
+    Reading a user's feed is a single range scan over (user, activity).
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ("user", "activity")
+        ordering = ["-activity"]
+        verbose_name = "User Feed Entry"
+        verbose_name_plural = "User Feed Entries"
+
+
+class GroupFeedEntry(models.Model):
+    """
+    Fan-out row linking an activity to the group feed it belongs to.
+    """
+
+    group = models.ForeignKey(Group, on_delete=models.DO_NOTHING, db_constraint=False)
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ("group", "activity")
+        ordering = ["-activity"]
+        verbose_name = "Group Feed Entry"
+        verbose_name_plural = "Group Feed Entries"
+
+
+class GroupLocked(ValidationError):
+    """A write to a group that is being moved between shards."""
+
+    def __init__(self):
+        super().__init__(
+            "This group is being moved. Please try again in a moment.",
+            code="group_locked",
+        )
+
+
+class GroupShardManager(models.Manager):
+    def allocate(self):
+        """Reserve a new group id and pin it to its home shard."""
+        with transaction.atomic(using=self.db):
+            entry = self.create(shard=0)
+            entry.shard = entry.pk % settings.DATABASE_SHARDS
+            if entry.shard:
+                self.filter(pk=entry.pk).update(shard=entry.shard)
+        return entry
+
+    def shard_for(self, group_id):
+        """Database alias holding the given group."""
+        shard = self.filter(pk=group_id).values_list("shard", flat=True).first()
+        return shard_alias(shard or 0)
+
+    def shards_for(self, group_ids):
+        """Map each database alias to the given group ids it holds."""
+        shards = dict(self.filter(pk__in=group_ids).values_list("pk", "shard"))
+        aliases = defaultdict(list)
+        for group_id in group_ids:
+            aliases[shard_alias(shards.get(group_id, 0))].append(group_id)
+        return aliases
+
+    def hold_writes(self, using):
+        """
+        Take the write lock of a shard database until the current transaction
+        ends, after transactions already writing to it have committed.
+        """
+        # Matches no rows, but still takes the lock
+        Group.objects.using(using).filter(pk=0).update(is_active=False)
+
+    def ensure_unlocked(self, using, group_ids=None):
+        """
+        Raise GroupLocked if any of the groups on shard `using` (by default,
+        any group there) is being moved.
+
+        Call it in the shard's transaction before writing to the groups. It
+        holds the shard's write lock, which move_group also takes before
+        copying a group, so a move that starts afterwards copies the writes.
+        """
+        self.hold_writes(using)
+        if group_ids is None:
+            locked = self.filter(shard=shard_aliases().index(using))
+        else:
+            locked = self.filter(pk__in=group_ids)
+        if locked.filter(is_locked=True).exists():
+            raise GroupLocked()
+
+
+class GroupShard(models.Model):
+    """
+    Shard map entry for a group, stored in the default database.
+    Its id is the group's id, so it also hands out ids that are unique
+    across every shard.
+    """
+
+    shard = models.PositiveSmallIntegerField(default=0)
+    # Set while the group is being moved; writes to it are refused meanwhile
+    is_locked = models.BooleanField(default=False)
+
+    objects = GroupShardManager()
+
+    class Meta:
+        verbose_name = "Group Shard"
+        verbose_name_plural = "Group Shards"
+
+    def __str__(self):
+        return f"Group {self.pk} on shard {self.shard}"
+
+    @property
+    def alias(self):
+        """Database alias of the shard."""
+        return shard_alias(self.shard)
+
+
+class PointsRollup(models.Model):
+    """
+    Net points change over one day or week, and the balance at its end.
+    Built incrementally from the points activities, see users.rollups.
+    """
+
+    DAY = "day"
+    WEEK = "week"
+
+    PERIOD_CHOICES = [
+        (DAY, "Day"),
+        (WEEK, "Week"),
+    ]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    delta = models.IntegerField(default=0)
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        ordering = ["period_start"]
+
+
+class MembershipPointsRollup(PointsRollup):
+    """Points rollup for one member of a group."""
+
+    group = models.ForeignKey(Group, on_delete=models.DO_NOTHING, db_constraint=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta(PointsRollup.Meta):
+        unique_together = ("group", "user", "period", "period_start")
+        verbose_name = "Membership Points Rollup"
+        verbose_name_plural = "Membership Points Rollups"
+
+
+class GroupPointsRollup(PointsRollup):
+    """Points rollup for a whole group."""
+
+    group = models.ForeignKey(Group, on_delete=models.DO_NOTHING, db_constraint=False)
+
+    class Meta(PointsRollup.Meta):
+        unique_together = ("group", "period", "period_start")
+        verbose_name = "Group Points Rollup"
+        verbose_name_plural = "Group Points Rollups"
+
+
+class RollupWatermark(models.Model):
+    """Id of the last activity a rollup has processed."""
+
+    name = models.CharField(max_length=50, unique=True)
+    last_activity_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Rollup Watermark"
+        verbose_name_plural = "Rollup Watermarks"
+
+    def __str__(self):
+        return f"{self.name} at activity {self.last_activity_id}"
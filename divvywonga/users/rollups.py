@@ -0,0 +1,245 @@
+"""
+Daily and weekly points rollups for trend charts.
+
+Every points change is recorded as a POINTS_AWARDED activity, and members
+leaving or being removed take their points along in the LEFT or REMOVED
+activity. Activities are only ever appended, so update_rollups folds in just
+the activities past its watermark. Charts read a few rollup rows instead of
+scanning raw history.
+
+The balances start from the membership points at the time of migration
+0006_seed_points_rollups.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from users.models import (
+    Activity,
+    GroupPointsRollup,
+    MembershipPointsRollup,
+    PointsRollup,
+    RollupWatermark,
+)
+
+ROLLUP_BATCH_SIZE = 1000
+WATERMARK_NAME = "points"
+# Activities that change a group's points
+POINTS_VERBS = (Activity.POINTS_AWARDED, Activity.LEFT, Activity.REMOVED)
+
+# Number of periods shown in a trend chart
+HISTORY_LENGTH = {PointsRollup.DAY: 30, PointsRollup.WEEK: 26}
+PERIOD_STEP = {
+    PointsRollup.DAY: timedelta(days=1),
+    PointsRollup.WEEK: timedelta(weeks=1),
+}
+
+CHART_WIDTH = 300
+CHART_HEIGHT = 80
+
+
+def period_start(period, day):
+    """First day of the day or week (starting on Monday) containing `day`."""
+    if period == PointsRollup.WEEK:
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def update_rollups(batch_size=ROLLUP_BATCH_SIZE):
+    """
+    Fold the points changes recorded since the last run into the rollups.
+    Each batch commits together with the watermark, so an interrupted run
+    resumes where it stopped. Returns the number of changes processed.
+    """
+    processed = 0
+    while True:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(
+                name=WATERMARK_NAME
+            )
+            changes = list(
+                Activity.objects.filter(
+                    verb__in=POINTS_VERBS,
+                    id__gt=watermark.last_activity_id,
+                    group__isnull=False,
+                )
+                .order_by("id")
+                .values_list(
+                    "id", "verb", "group_id", "target_id", "created_at", "data"
+                )[:batch_size]
+            )
+            if not changes:
+                return processed
+
+            for period in (PointsRollup.DAY, PointsRollup.WEEK):
+                member_changes = {}
+                group_changes = {}
+                for _, verb, group_id, user_id, created_at, data in changes:
+                    if verb == Activity.POINTS_AWARDED:
+                        delta, points = data["delta"], data["points"]
+                    else:
+                        # The member left with their points
+                        delta, points = -data.get("points", 0), 0
+                    if not delta:
+                        continue
+
+                    start = period_start(period, timezone.localdate(created_at))
+                    if user_id:
+                        _add_change(
+                            member_changes, (group_id, user_id, start), delta, points
+                        )
+                    _add_change(group_changes, (group_id, start), delta)
+
+                _fold_changes(
+                    MembershipPointsRollup,
+                    ("group_id", "user_id"),
+                    period,
+                    member_changes,
+                )
+                _fold_changes(GroupPointsRollup, ("group_id",), period, group_changes)
+
+            watermark.last_activity_id = changes[-1][0]
+            watermark.save(update_fields=["last_activity_id", "updated_at"])
+        processed += len(changes)
+
+
+def _add_change(changes, key, delta, points=None):
+    change = changes.setdefault(key, [0, None])
+    change[0] += delta
+    if points is not None:
+        change[1] = points
+
+
+def _fold_changes(model, key_fields, period, changes):
+    """
+    Add `changes`, a {(*key, period_start): [delta, points]} dict, to the
+    rollups of `model`. A points value of None carries the previous balance
+    forward by the delta instead of setting it.
+    """
+    if not changes:
+        return
+
+    # New changes continue from the balance in the latest row of each key
+    rollups = model.objects.filter(period=period)
+    latest = rollups.filter(
+        **{
+            f"{field}__in": {key[i] for key in changes}
+            for i, field in enumerate(key_fields)
+        },
+        period_start=Subquery(
+            rollups.filter(**{field: OuterRef(field) for field in key_fields})
+            .order_by("-period_start")
+            .values("period_start")[:1]
+        ),
+    )
+    current = {
+        tuple(getattr(rollup, field) for field in key_fields): rollup
+        for rollup in latest
+    }
+
+    created, updated = [], []
+    for *key, start in sorted(changes, key=lambda key: key[-1]):
+        key = tuple(key)
+        delta, points = changes[(*key, start)]
+        rollup = current.get(key)
+        # A change stamped before the latest period (clock skew between
+        # workers around midnight) is counted in that period instead
+        if rollup is None or rollup.period_start < start:
+            balance = rollup.points if rollup is not None else 0
+            rollup = model(
+                period=period,
+                period_start=start,
+                points=balance,
+                **dict(zip(key_fields, key)),
+            )
+            current[key] = rollup
+            created.append(rollup)
+        elif rollup.pk and rollup not in updated:
+            updated.append(rollup)
+        rollup.delta += delta
+        rollup.points = points if points is not None else rollup.points + delta
+
+    model.objects.bulk_create(created)
+    model.objects.bulk_update(updated, ["delta", "points"])
+
+
+def points_history(rollups, period, today=None):
+    """
+    Return (period_start, delta, points) for the latest HISTORY_LENGTH periods,
+    oldest first. `rollups` is the rollup queryset of one group or membership;
+    periods without changes keep the previous balance.
+    """
+    step = PERIOD_STEP[period]
+    last = period_start(period, today or timezone.localdate())
+    first = last - step * (HISTORY_LENGTH[period] - 1)
+
+    rollups = rollups.filter(period=period)
+    rows = {
+        rollup.period_start: rollup
+        for rollup in rollups.filter(period_start__gte=first)
+    }
+    points = (
+        rollups.filter(period_start__lt=first)
+        .order_by("-period_start")
+        .values_list("points", flat=True)
+        .first()
+        or 0
+    )
+
+    history = []
+    for i in range(HISTORY_LENGTH[period]):
+        start = first + step * i
+        delta = 0
+        if start in rows:
+            delta, points = rows[start].delta, rows[start].points
+        history.append((start, delta, points))
+    return history
+
+
+def points_chart(history, title):
+    """Template context for users/includes/points_chart.html."""
+    top = max(points for _, _, points in history) or 1
+    step = CHART_WIDTH / max(len(history) - 1, 1)
+    line = " ".join(
+        f"{i * step:.1f},{CHART_HEIGHT - points * CHART_HEIGHT / top:.1f}"
+        for i, (_, _, points) in enumerate(history)
+    )
+    return {
+        "title": title,
+        "line": line,
+        "width": CHART_WIDTH,
+        "height": CHART_HEIGHT,
+        "first": history[0][0],
+        "last": history[-1][0],
+        "points": history[-1][2],
+        "change": sum(delta for _, delta, _ in history),
+    }
+
+
+def points_charts(rollups):
+    """Daily and weekly trend charts for a group's or membership's rollups."""
+    return [
+        points_chart(points_history(rollups, PointsRollup.DAY), "Last 30 days"),
+        points_chart(points_history(rollups, PointsRollup.WEEK), "Last 26 weeks"),
+    ]
+
+
+def collect_metrics():
+    """Points changes waiting for the next rollup_points run, for /metrics."""
+    watermark = (
+        RollupWatermark.objects.filter(name=WATERMARK_NAME)
+        .values_list("last_activity_id", flat=True)
+        .first()
+        or 0
+    )
+    backlog = Activity.objects.filter(verb__in=POINTS_VERBS, id__gt=watermark).count()
+    return [
+        (
+            "gauge",
+            "divvywonga_points_rollup_backlog",
+            "Points changes not yet folded into the rollups.",
+            [({}, backlog)],
+        )
+    ]
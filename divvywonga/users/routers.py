@@ -0,0 +1,62 @@
+from users.models import Group, GroupShard
+from users.sharding import SHARDED_MODELS, current_shard, is_sharded, shard_aliases
+
+
+def _group_id(instance):
+    if isinstance(instance, Group):
+        return instance.pk
+    # Read the attribute directly so a deferred field isn't loaded (and routed)
+    return instance.__dict__.get("group_id")
+
+
+class ShardRouter:
+    """
+    Route groups and memberships to the shard holding their group and
+    everything else to the default database.
+
+    Queries without an instance hint (e.g. Membership.objects.filter(...))
+    use the shard selected for the current request by ShardMiddleware.
+    """
+
+    def _db_for(self, model, instance=None, **hints):
+        if not is_sharded(model):
+            return "default"
+
+        if instance is not None:
+            # Saved sharded objects already know where they live; new ones
+            # (and hints from other models) are placed by their group
+            if (
+                is_sharded(instance)
+                and instance._state.db
+                and not instance._state.adding
+            ):
+                return instance._state.db
+
+            group_id = _group_id(instance)
+            if group_id is not None:
+                return GroupShard.objects.shard_for(group_id)
+
+        return current_shard() or "default"
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        sharded1, sharded2 = is_sharded(obj1), is_sharded(obj2)
+        if sharded1 != sharded2:
+            # e.g. a membership pointing at a user in the default database
+            return True
+        if sharded1 and sharded2:
+            group_id1, group_id2 = _group_id(obj1), _group_id(obj2)
+            return group_id1 is None or group_id2 is None or group_id1 == group_id2
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == "default":
+            return True
+        if db in shard_aliases():
+            return app_label == "users" and model_name in SHARDED_MODELS
+        return None
@@ -0,0 +1,51 @@
+"""
+Helpers for spreading group data over several SQLite databases.
+
+Each group and its memberships live in one shard database; shard 0 is the
+"default" database, which also holds everything that isn't group data
+(users, sessions, the activity feeds and the GroupShard map itself).
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Models whose rows are stored in the shard of the group they belong to
+SHARDED_MODELS = {"group", "membership"}
+
+_current_shard = ContextVar("current_shard", default=None)
+
+
+def shard_alias(shard):
+    """Database alias for a shard number."""
+    return "default" if shard == 0 else f"shard_{shard}"
+
+
+def shard_aliases():
+    return [shard_alias(shard) for shard in range(settings.DATABASE_SHARDS)]
+
+
+def is_sharded(model):
+    """Whether rows of a model (or model instance) are stored per group shard."""
+    return model._meta.app_label == "users" and model._meta.model_name in SHARDED_MODELS
+
+
+def current_shard():
+    """Alias of the shard selected for the current request, if any."""
+    return _current_shard.get()
+
+
+def select_shard(alias):
+    """Select the shard for the rest of the current context (see use_shard)."""
+    _current_shard.set(alias)
+
+
+@contextmanager
+def use_shard(alias):
+    """Route queries on sharded models without an instance hint to `alias`."""
+    token = _current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_shard.reset(token)
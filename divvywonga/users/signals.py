@@ -0,0 +1,80 @@
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from users.activity import make_activity, record_activities
+from users.backends import invalidate_cached_user
+from users.models import (
+    Activity,
+    Group,
+    GroupFeedEntry,
+    GroupPointsRollup,
+    GroupShard,
+    Membership,
+    MembershipPointsRollup,
+)
+from users.sharding import shard_aliases
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """
+    Keep the cached user in sync with password, permission and profile
+    changes. The entry is dropped once the change is committed, so a request
+    can't cache the user as it was before the change in the meantime.
+    """
+    transaction.on_commit(
+        partial(invalidate_cached_user, instance.pk), using=instance._state.db
+    )
+
+
+@receiver(post_delete, sender=User)
+def delete_sharded_memberships(sender, instance, **kwargs):
+    """Remove the user's memberships from shards the delete cascade can't reach."""
+    for alias in shard_aliases():
+        if alias != instance._state.db:
+            Membership.objects.using(alias).filter(user_id=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=User)
+def remember_user_memberships(sender, instance, **kwargs):
+    """Keep the deleted user's memberships for record_user_departures."""
+    instance._departed_memberships = [
+        membership
+        for alias in shard_aliases()
+        for membership in Membership.objects.using(alias)
+        .filter(user_id=instance.pk)
+        .select_related("group")
+    ]
+
+
+@receiver(post_delete, sender=User)
+def record_user_departures(sender, instance, **kwargs):
+    """
+    Record the deleted user leaving their groups, so the points they had
+    leave the group rollups. Runs after delete_sharded_memberships, so the
+    activities don't fan out to the deleted user.
+    """
+    record_activities(
+        [
+            make_activity(Activity.LEFT, membership.group, points=membership.points)
+            for membership in getattr(instance, "_departed_memberships", ())
+        ]
+    )
+
+
+@receiver(post_delete, sender=Group)
+def forget_deleted_group(sender, instance, **kwargs):
+    """Clean up the group's rows in the default database once it is deleted."""
+    if GroupShard.objects.shard_for(instance.pk) != instance._state.db:
+        # The group was moved to another shard and this was the stale copy
+        return
+
+    Activity.objects.filter(group_id=instance.pk).update(group=None)
+    GroupFeedEntry.objects.filter(group_id=instance.pk).delete()
+    GroupPointsRollup.objects.filter(group_id=instance.pk).delete()
+    MembershipPointsRollup.objects.filter(group_id=instance.pk).delete()
+    GroupShard.objects.filter(pk=instance.pk).delete()
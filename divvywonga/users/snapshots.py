@@ -0,0 +1,276 @@
+"""
+Compact, streaming snapshots of a single group.
+
+A snapshot is gzip-compressed JSON Lines: a header, the group, then its
+memberships and its activities, one record per line. Users are referred to
+by username, so a snapshot can be imported into another environment. Both
+directions work in batches, so memory use doesn't grow with the group.
+
+Points rollups aren't included; rollup_points rebuilds them from the
+imported activities.
+"""
+
+import gzip
+import json
+from datetime import datetime
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, When
+from users.models import Activity, Group, GroupFeedEntry, GroupShard, Membership
+from users.sharding import shard_aliases
+
+SNAPSHOT_FORMAT = "divvywonga-group"
+SNAPSHOT_VERSION = 1
+# Records per batch. Restoring the times of a batch binds three parameters per
+# record, which has to stay within SQLite's limit of 999 bound parameters on
+# older versions, as in move_group
+SNAPSHOT_BATCH_SIZE = 250
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def export_group(group_id, file):
+    """Write a snapshot of the group to a binary file; return the record count."""
+    alias = GroupShard.objects.shard_for(group_id)
+    usernames = {}
+    count = 0
+
+    with gzip.open(file, "wt") as out, transaction.atomic(using=alias):
+        group = Group.objects.using(alias).filter(pk=group_id).first()
+        if group is None:
+            raise SnapshotError(f"Group {group_id} does not exist.")
+
+        def write(record):
+            nonlocal count
+            out.write(json.dumps(record, separators=(",", ":")) + "\n")
+            count += 1
+
+        write({"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION})
+        write(
+            {
+                "type": "group",
+                "name": group.name,
+                "description": group.description,
+                "is_active": group.is_active,
+                "created_at": group.created_at.isoformat(),
+                "updated_at": group.updated_at.isoformat(),
+            }
+        )
+
+        memberships = (
+            Membership.objects.using(alias)
+            .filter(group_id=group_id)
+            .order_by("pk")
+            .values_list("user_id", "points", "role", "is_active", "joined_at")
+        )
+        for batch in _batches(memberships.iterator(SNAPSHOT_BATCH_SIZE)):
+            _load_usernames(usernames, (row[0] for row in batch))
+            for user_id, points, role, is_active, joined_at in batch:
+                write(
+                    {
+                        "type": "membership",
+                        "user": usernames[user_id],
+                        "points": points,
+                        "role": role,
+                        "is_active": is_active,
+                        "joined_at": joined_at.isoformat(),
+                    }
+                )
+
+        activities = (
+            Activity.objects.filter(group_id=group_id)
+            .order_by("pk")
+            .values_list("verb", "actor_id", "target_id", "data", "created_at")
+        )
+        for batch in _batches(activities.iterator(SNAPSHOT_BATCH_SIZE)):
+            _load_usernames(usernames, (row[i] for row in batch for i in (1, 2)))
+            for verb, actor_id, target_id, data, created_at in batch:
+                write(
+                    {
+                        "type": "activity",
+                        "verb": verb,
+                        "actor": usernames.get(actor_id),
+                        "target": usernames.get(target_id),
+                        "data": data,
+                        "created_at": created_at.isoformat(),
+                    }
+                )
+
+    return count
+
+
+def import_group(file, name=None, create_users=False):
+    """
+    Create a new group from a snapshot read from a binary file and return it.
+    The group gets a new id; `name` replaces the one in the snapshot. Users
+    must exist unless `create_users` is set, which creates missing ones as
+    inactive users without a usable password.
+    """
+    with gzip.open(file, "rt") as lines:
+        records = (json.loads(line) for line in lines)
+        header = next(records, None)
+        if header != {"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION}:
+            raise SnapshotError("Not a group snapshot, or an unsupported version.")
+
+        record = next(records, None)
+        if record is None or record["type"] != "group":
+            raise SnapshotError("The snapshot doesn't start with a group.")
+
+        with transaction.atomic():
+            entry = GroupShard.objects.allocate()
+            group = _import(entry, record, records, name, create_users)
+
+    return group
+
+
+def _import(entry, group_record, records, name, create_users):
+    """Create the group and add the remaining records in its shard's transaction."""
+    with transaction.atomic(using=entry.alias):
+        group = _create_group(entry, group_record, name)
+        importers = {
+            "membership": lambda batch: _import_memberships(group, batch, create_users),
+            "activity": lambda batch: _import_activities(group, batch, create_users),
+        }
+
+        batch = []
+        for record in records:
+            if batch and (
+                record["type"] != batch[0]["type"] or len(batch) >= SNAPSHOT_BATCH_SIZE
+            ):
+                importers[batch[0]["type"]](batch)
+                batch = []
+            if record["type"] not in importers:
+                raise SnapshotError(f"Unknown record type: {record['type']}")
+            batch.append(record)
+        if batch:
+            importers[batch[0]["type"]](batch)
+    return group
+
+
+def _create_group(entry, record, name):
+    name = name or record["name"]
+    if any(
+        Group.objects.using(alias).filter(name=name).exists()
+        for alias in shard_aliases()
+    ):
+        raise SnapshotError(f'A group named "{name}" already exists.')
+
+    group = Group(
+        pk=entry.pk,
+        name=name,
+        description=record["description"],
+        is_active=record["is_active"],
+    )
+    group.save(using=entry.alias, force_insert=True)
+    # Saving stamps new times; restore the original ones
+    Group.objects.using(entry.alias).filter(pk=group.pk).update(
+        created_at=record["created_at"], updated_at=record["updated_at"]
+    )
+    return group
+
+
+def _import_memberships(group, batch, create_users):
+    users = _resolve_users((record["user"] for record in batch), create_users)
+    memberships = [
+        Membership(
+            group=group,
+            user_id=users[record["user"]],
+            points=record["points"],
+            role=record["role"],
+            is_active=record["is_active"],
+        )
+        for record in batch
+    ]
+    Membership.objects.using(group._state.db).bulk_create(memberships)
+
+    # bulk_create stamps joined_at; restore the snapshot's times
+    Membership.objects.using(group._state.db).filter(
+        group=group, user_id__in=[m.user_id for m in memberships]
+    ).update(
+        joined_at=Case(
+            *(
+                When(user_id=users[record["user"]], then=_datetime(record["joined_at"]))
+                for record in batch
+            )
+        )
+    )
+
+
+def _import_activities(group, batch, create_users):
+    usernames = [
+        username
+        for record in batch
+        for username in (record["actor"], record["target"])
+        if username
+    ]
+    users = _resolve_users(usernames, create_users)
+    activities = Activity.objects.bulk_create(
+        [
+            Activity(
+                verb=record["verb"],
+                group=group,
+                group_name=group.name,
+                actor_id=users.get(record["actor"]),
+                target_id=users.get(record["target"]),
+                data=record["data"],
+            )
+            for record in batch
+        ]
+    )
+    Activity.objects.filter(pk__in=[a.pk for a in activities]).update(
+        created_at=Case(
+            *(
+                When(pk=activity.pk, then=_datetime(record["created_at"]))
+                for activity, record in zip(activities, batch)
+            )
+        )
+    )
+    # Member feeds only get new activities; the group feed gets its history
+    GroupFeedEntry.objects.bulk_create(
+        GroupFeedEntry(group=group, activity=activity) for activity in activities
+    )
+
+
+def _resolve_users(usernames, create_users):
+    """Map usernames to user ids, creating missing users when allowed."""
+    usernames = set(usernames)
+    users = dict(
+        User.objects.filter(username__in=usernames).values_list("username", "pk")
+    )
+    missing = usernames - users.keys()
+    if missing and not create_users:
+        names = sorted(missing)
+        more = f" and {len(names) - 10} more" if len(names) > 10 else ""
+        raise SnapshotError(f"Unknown users: {', '.join(names[:10])}{more}")
+    if missing:
+        password = make_password(None)
+        created = User.objects.bulk_create(
+            User(username=username, password=password, is_active=False)
+            for username in missing
+        )
+        users.update((user.username, user.pk) for user in created)
+    return users
+
+
+def _load_usernames(usernames, user_ids):
+    """Add the usernames of the given user ids to the `usernames` cache."""
+    missing = {user_id for user_id in user_ids if user_id and user_id not in usernames}
+    if missing:
+        usernames.update(
+            User.objects.filter(pk__in=missing).values_list("pk", "username")
+        )
+
+
+def _batches(iterable, size=SNAPSHOT_BATCH_SIZE):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _datetime(value):
+    return datetime.fromisoformat(value)
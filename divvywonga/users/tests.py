@@ -1,3 +1,716 @@
-from django.test import TestCase
+import json
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users.activity import make_activity, paginate_feed, record_activities
+from users.backends import CachedModelBackend
+from users.members import apply_member_action, last_admins
+from users.models import (
+    Activity,
+    Group,
+    GroupFeedEntry,
+    GroupLocked,
+    GroupPointsRollup,
+    GroupShard,
+    Membership,
+    MembershipPointsRollup,
+    PointsRollup,
+    UserFeedEntry,
+)
+from users.rollups import update_rollups
+from users.routers import ShardRouter
+from users.sharding import select_shard, use_shard
+from users.snapshots import SnapshotError, export_group, import_group
+from users.views import _user_memberships
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=["users.backends.CachedModelBackend"],
+    SESSION_ENGINE="django.contrib.sessions.backends.cached_db",
+)
+class CachedUserTests(TestCase):
+    """Users and sessions read from the cache, as with a shared cache backend."""
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", password="pw")
+
+    def setUp(self):
+        cache = caches[settings.AUTH_USER_CACHE_ALIAS]
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.backend = CachedModelBackend()
+
+    def test_second_get_user_is_cached(self):
+        self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+
+    def test_saved_user_is_reloaded_after_commit(self):
+        self.backend.get_user(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = "Alice"
+            self.user.save()
+            self.assertEqual(self.backend.get_user(self.user.pk).first_name, "")
+        self.assertEqual(self.backend.get_user(self.user.pk).first_name, "Alice")
+
+    def test_deleted_user_is_dropped(self):
+        self.backend.get_user(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    async def test_async_get_user_is_cached(self):
+        self.assertEqual(await self.backend.aget_user(self.user.pk), self.user)
+        # update() sends no signals, so the cached user is kept
+        await User.objects.filter(pk=self.user.pk).aupdate(username="bob")
+        user = await self.backend.aget_user(self.user.pk)
+        self.assertEqual(user.username, "alice")
+
+    def test_session_is_read_from_the_cache(self):
+        self.client.force_login(self.user)
+        Session.objects.all().delete()
+        response = self.client.get(reverse("index"))
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+
+class ActivityFeedTests(TestCase):
+    """Fan-out of activities to the feeds and paging through them."""
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("alice", password="pw")
+        cls.member = User.objects.create_user("bob")
+        cls.inactive = User.objects.create_user("carol")
+        cls.outsider = User.objects.create_user("dave")
+        cls.group = Group.objects.create(name="Flat")
+        Membership.objects.create(user=cls.admin, group=cls.group, role="admin")
+        Membership.objects.create(user=cls.member, group=cls.group)
+        Membership.objects.create(user=cls.inactive, group=cls.group, is_active=False)
+
+    def test_activity_reaches_members_and_group(self):
+        (activity,) = record_activities(
+            [make_activity(Activity.INVITED, self.group, self.admin, self.outsider)]
+        )
+        self.assertEqual(
+            set(
+                UserFeedEntry.objects.filter(activity=activity).values_list(
+                    "user_id", flat=True
+                )
+            ),
+            {self.admin.pk, self.member.pk, self.outsider.pk},
+        )
+        self.assertEqual(
+            list(GroupFeedEntry.objects.filter(activity=activity)),
+            [GroupFeedEntry.objects.get(group=self.group, activity=activity)],
+        )
+
+    def test_pages_neither_repeat_nor_skip(self):
+        record_activities(
+            [make_activity(Activity.POINTS_AWARDED, self.group) for _ in range(7)]
+        )
+        entries = GroupFeedEntry.objects.filter(group=self.group)
+        expected = list(
+            entries.order_by("-activity_id").values_list("activity_id", flat=True)
+        )
+
+        seen, cursor = [], None
+        while True:
+            activities, cursor = paginate_feed(entries, cursor, page_size=3)
+            seen.extend(activity.pk for activity in activities)
+            if cursor is None:
+                break
+            self.assertEqual(len(activities), 3)
+        self.assertEqual(seen, expected)
+
+        # A last page that is exactly full has no next page
+        page, cursor = paginate_feed(entries, expected[-4], page_size=3)
+        self.assertEqual([a.pk for a in page], expected[-3:])
+        self.assertIsNone(cursor)
+
+    def test_invalid_or_absent_cursor_starts_at_the_newest(self):
+        *_, newest = record_activities(
+            [make_activity(Activity.POINTS_AWARDED, self.group) for _ in range(30)]
+        )
+        url = reverse("group_activity_feed", args=[self.group.pk])
+        self.client.force_login(self.admin)
+        for query in ("", "?cursor=", "?cursor=abc", "?cursor=-5"):
+            with self.subTest(query=query):
+                response = self.client.get(url + query)
+                self.assertEqual(response.context["activities"][0], newest)
+
+
+class GroupEventsTests(TestCase):
+    """The Server-Sent Events stream of live group updates."""
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", password="pw")
+        cls.member = User.objects.create_user("bob", password="pw")
+        cls.group = Group.objects.create(name="Flat")
+        Membership.objects.create(user=cls.user, group=cls.group, role="admin")
+        Membership.objects.create(user=cls.member, group=cls.group)
+        cls.url = reverse("group_events", args=[cls.group.id])
+
+    def setUp(self):
+        select_shard(self.group._state.db)
+        self.addCleanup(select_shard, None)
+
+    @asynccontextmanager
+    async def open_stream(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        try:
+            yield stream
+        finally:
+            # Runs the stream's cleanup, which unsubscribes it
+            await stream.aclose()
+
+    def award_points(self, points):
+        memberships = Membership.objects.filter(user=self.member, group=self.group)
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_member_action(memberships, "adjust_points", self.user, points)
+
+    async def test_stream_starts_with_retry_interval(self):
+        async with self.open_stream() as stream:
+            self.assertEqual(await anext(stream), b"retry: 5000\n\n")
+
+    @override_settings(SSE_HEARTBEAT_INTERVAL=0.01)
+    async def test_heartbeat_when_idle(self):
+        async with self.open_stream() as stream:
+            await anext(stream)
+            self.assertEqual(await anext(stream), b": heartbeat\n\n")
+
+    async def test_membership_change_is_pushed_as_diff(self):
+        async with self.open_stream() as stream:
+            await anext(stream)
+            await sync_to_async(self.award_points)(5)
+            event = await anext(stream)
+
+        self.assertTrue(event.startswith(b"data: "))
+        self.assertEqual(
+            json.loads(event.removeprefix(b"data: ")),
+            {
+                "events": [
+                    {
+                        "verb": "points_awarded",
+                        "delta": 5,
+                        "points": 5,
+                        "user_id": self.member.pk,
+                        "username": "bob",
+                    }
+                ]
+            },
+        )
+
+    @override_settings(SSE_QUEUE_SIZE=1)
+    async def test_overflowing_client_is_told_to_resync(self):
+        async with self.open_stream() as stream:
+            await anext(stream)
+            await sync_to_async(self.award_points)(1)
+            await sync_to_async(self.award_points)(1)
+
+            self.assertEqual(await anext(stream), b"event: resync\ndata: {}\n\n")
+            with self.assertRaises(StopAsyncIteration):
+                await anext(stream)
+
+    async def test_non_member_is_refused(self):
+        outsider = await User.objects.acreate_user("carol", password="pw")
+        await self.async_client.aforce_login(outsider)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_wsgi_gets_no_content(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 204)
+
+        response = self.client.get(reverse("group_detail", args=[self.group.id]))
+        self.assertNotContains(response, "EventSource")
+
+
+class PointsRollupTests(TestCase):
+    """Incremental points rollups built by users.rollups.update_rollups."""
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("alice")
+        cls.member = User.objects.create_user("bob")
+        cls.group = Group.objects.create(name="Flat")
+        Membership.objects.create(user=cls.admin, group=cls.group, role="admin")
+        Membership.objects.create(user=cls.member, group=cls.group)
+
+    def setUp(self):
+        # Queries without an instance hint go to the group's shard, as in
+        # the requests for the group
+        select_shard(self.group._state.db)
+        self.addCleanup(select_shard, None)
+
+    def adjust(self, user, points):
+        apply_member_action(
+            Membership.objects.filter(user=user, group=self.group),
+            "adjust_points",
+            self.admin,
+            points,
+        )
+
+    def balance(self, model, **filters):
+        rollup = model.objects.filter(period=PointsRollup.DAY, **filters).last()
+        return rollup.points if rollup else 0
+
+    def assertGroupBalanceMatchesMembers(self):
+        total = Membership.objects.filter(group=self.group).aggregate(
+            total=Sum("points")
+        )["total"]
+        self.assertEqual(
+            self.balance(GroupPointsRollup, group_id=self.group.id), total or 0
+        )
+
+    def test_only_new_changes_are_folded(self):
+        self.adjust(self.member, 10)
+        self.adjust(self.admin, 5)
+        self.assertEqual(update_rollups(), 2)
+        self.assertEqual(update_rollups(), 0)
+
+        self.adjust(self.member, -3)
+        self.assertEqual(update_rollups(batch_size=1), 1)
+        self.assertEqual(
+            self.balance(
+                MembershipPointsRollup, user=self.member, group_id=self.group.id
+            ),
+            7,
+        )
+        self.assertGroupBalanceMatchesMembers()
+
+        rollup = GroupPointsRollup.objects.get(
+            group_id=self.group.id, period=PointsRollup.DAY
+        )
+        self.assertEqual(rollup.delta, 12)
+
+    def test_removed_member_takes_points_along(self):
+        self.adjust(self.member, 15)
+        self.adjust(self.admin, 30)
+        apply_member_action(
+            Membership.objects.filter(user=self.member, group=self.group),
+            "remove",
+            self.admin,
+        )
+        update_rollups()
+
+        self.assertEqual(
+            self.balance(
+                MembershipPointsRollup, user=self.member, group_id=self.group.id
+            ),
+            0,
+        )
+        self.assertGroupBalanceMatchesMembers()
+
+    def test_deleted_user_takes_points_along(self):
+        self.adjust(self.member, 15)
+        self.adjust(self.admin, 30)
+        update_rollups()
+        self.member.delete()
+        update_rollups()
+
+        self.assertGroupBalanceMatchesMembers()
+
+
+class MemberManagementTests(TestCase):
+    """Bulk member actions, leaving, and the last-admin invariant."""
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("alice", password="pw")
+        cls.moderator = User.objects.create_user("bob", password="pw")
+        cls.member = User.objects.create_user("carol", password="pw")
+        cls.superuser = User.objects.create_superuser("root", password="pw")
+        cls.group = Group.objects.create(name="Flat")
+        for user, role in (
+            (cls.admin, "admin"),
+            (cls.moderator, "moderator"),
+            (cls.member, "member"),
+        ):
+            Membership.objects.create(user=user, group=cls.group, role=role)
+
+    def setUp(self):
+        select_shard(self.group._state.db)
+        self.addCleanup(select_shard, None)
+
+    def membership(self, user):
+        return Membership.objects.filter(user=user, group=self.group)
+
+    def admin_url(self, name, *args):
+        shard = GroupShard.objects.get(pk=self.group.pk).shard
+        return reverse(f"admin:{name}", args=args) + f"?shard={shard}"
+
+    def manage(self, user, action, *members, points=""):
+        self.client.force_login(user)
+        return self.client.post(
+            reverse("manage_members", args=[self.group.id]),
+            {
+                "action": action,
+                "memberships": [self.membership(m).get().pk for m in members],
+                "points": points,
+            },
+        )
+
+    def message_texts(self, response):
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+    def test_last_admin_cannot_be_removed_or_deactivated(self):
+        for action in ("remove", "deactivate"):
+            with self.assertRaises(ValidationError):
+                apply_member_action(self.membership(self.admin), action, self.admin)
+        self.assertTrue(self.membership(self.admin).get().is_active)
+        self.assertEqual(last_admins(self.membership(self.member)), [])
+        self.assertEqual(
+            last_admins(Membership.objects.filter(group=self.group)),
+            [self.membership(self.admin).get()],
+        )
+
+    def test_removal_is_all_or_nothing(self):
+        with self.assertRaises(ValidationError):
+            apply_member_action(
+                Membership.objects.filter(group=self.group), "remove", self.admin
+            )
+        self.assertEqual(Membership.objects.filter(group=self.group).count(), 3)
+
+    def test_last_admin_cannot_leave(self):
+        self.client.force_login(self.admin)
+        self.client.post(reverse("leave_group", args=[self.group.id]))
+        self.assertTrue(self.membership(self.admin).exists())
+
+    def test_member_can_leave(self):
+        self.client.force_login(self.member)
+        self.client.post(reverse("leave_group", args=[self.group.id]))
+        self.assertFalse(self.membership(self.member).exists())
+
+    async def test_write_to_moving_group_is_refused(self):
+        await GroupShard.objects.filter(pk=self.group.pk).aupdate(is_locked=True)
+        await self.async_client.aforce_login(self.member)
+        response = await self.async_client.post(
+            reverse("leave_group", args=[self.group.id])
+        )
+        self.assertRedirects(
+            response,
+            reverse("group_detail", args=[self.group.id]),
+            fetch_redirect_response=False,
+        )
+        self.assertTrue(await self.membership(self.member).aexists())
+
+    def test_moderator_manages_regular_members_only(self):
+        response = self.manage(
+            self.moderator, "adjust_points", self.member, self.admin, points="5"
+        )
+        self.assertEqual(self.membership(self.member).get().points, 5)
+        self.assertEqual(self.membership(self.admin).get().points, 0)
+        self.assertEqual(self.message_texts(response), ["Updated 1 member(s)."])
+
+    def test_moderator_selection_without_regular_members(self):
+        response = self.manage(self.moderator, "remove", self.admin)
+        self.assertTrue(self.membership(self.admin).exists())
+        self.assertEqual(
+            self.message_texts(response),
+            ["Moderators can only manage regular members."],
+        )
+
+    def test_moderator_cannot_change_roles(self):
+        self.manage(self.moderator, "make_moderator", self.member)
+        self.assertEqual(self.membership(self.member).get().role, "member")
+
+    def test_admin_delete_refuses_last_admin(self):
+        self.client.force_login(self.superuser)
+        url = self.admin_url("users_membership_changelist")
+        pks = [m.pk for m in Membership.objects.filter(group=self.group)]
+        response = self.client.post(
+            url, {"action": "delete_selected", "_selected_action": pks, "post": "yes"}
+        )
+        self.assertEqual(Membership.objects.filter(group=self.group).count(), 3)
+        self.assertContains(response, "the last admin of Flat")
+
+        pks.remove(self.membership(self.admin).get().pk)
+        self.client.post(
+            url, {"action": "delete_selected", "_selected_action": pks, "post": "yes"}
+        )
+        self.assertEqual(Membership.objects.filter(group=self.group).count(), 1)
+
+    def test_admin_change_form_keeps_an_admin(self):
+        self.client.force_login(self.superuser)
+        admin = self.membership(self.admin).get()
+        response = self.client.post(
+            self.admin_url("users_membership_change", admin.pk),
+            {
+                "user": self.admin.pk,
+                "group": self.group.pk,
+                "points": 0,
+                "role": "member",
+                "is_active": "on",
+            },
+        )
+        self.assertEqual(self.membership(self.admin).get().role, "admin")
+        self.assertIn(
+            "A group must keep at least one admin. Please assign another admin first.",
+            self.message_texts(response),
+        )
+
+    def test_group_inline_keeps_an_admin(self):
+        self.client.force_login(self.superuser)
+        data = {
+            "name": self.group.name,
+            "description": "",
+            "is_active": "on",
+            "membership_set-TOTAL_FORMS": 3,
+            "membership_set-INITIAL_FORMS": 3,
+            "membership_set-MIN_NUM_FORMS": 0,
+            "membership_set-MAX_NUM_FORMS": 1000,
+        }
+        for index, membership in enumerate(Membership.objects.filter(group=self.group)):
+            prefix = f"membership_set-{index}-"
+            data |= {
+                prefix + "id": membership.pk,
+                prefix + "group": self.group.pk,
+                prefix + "user": membership.user_id,
+                prefix + "points": membership.points,
+                prefix + "role": membership.role,
+                prefix + "is_active": "on",
+            }
+            if membership.role == "admin":
+                data[prefix + "DELETE"] = "on"
+
+        self.client.post(self.admin_url("users_group_change", self.group.pk), data)
+        self.assertTrue(self.membership(self.admin).exists())
+
+    def test_actions_in_group_without_admin(self):
+        self.membership(self.admin).update(is_active=False)
+        apply_member_action(
+            self.membership(self.member), "adjust_points", self.admin, 3
+        )
+        self.assertEqual(self.membership(self.member).get().points, 3)
+
+    def test_admin_adjust_points_action(self):
+        self.client.force_login(self.superuser)
+        self.client.post(
+            self.admin_url("users_membership_changelist"),
+            {
+                "action": "adjust_points",
+                "_selected_action": [self.membership(self.member).get().pk],
+                "points": "7",
+            },
+        )
+        self.assertEqual(self.membership(self.member).get().points, 7)
+
+
+class SnapshotTests(TestCase):
+    """Group snapshots written by export_group and read by import_group."""
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("alice")
+        cls.member = User.objects.create_user("bob")
+        cls.group = Group.objects.create(name="Flat", description="Shared flat")
+        Membership.objects.create(user=cls.admin, group=cls.group, role="admin")
+        Membership.objects.create(user=cls.member, group=cls.group, points=3)
+
+    def export(self):
+        file = BytesIO()
+        export_group(self.group.pk, file)
+        file.seek(0)
+        return file
+
+    def memberships(self, group):
+        return set(
+            Membership.objects.using(group._state.db)
+            .filter(group=group)
+            .values_list("user_id", "role", "points", "is_active", "joined_at")
+        )
+
+    def activities(self, group):
+        return list(
+            Activity.objects.filter(group=group)
+            .order_by("pk")
+            .values_list("verb", "actor_id", "target_id", "data", "created_at")
+        )
+
+    def test_round_trip(self):
+        group = import_group(self.export(), name="Flat again")
+
+        self.assertNotEqual(group.pk, self.group.pk)
+        self.assertEqual(group._state.db, GroupShard.objects.shard_for(group.pk))
+        copy = Group.objects.using(group._state.db).get(pk=group.pk)
+        self.assertEqual(copy.description, "Shared flat")
+        self.assertEqual(copy.created_at, self.group.created_at)
+        self.assertEqual(self.memberships(group), self.memberships(self.group))
+        self.assertEqual(self.activities(group), self.activities(self.group))
+        self.assertEqual(
+            GroupFeedEntry.objects.filter(group=group).count(),
+            len(self.activities(group)),
+        )
+
+    def test_name_conflict_leaves_nothing_behind(self):
+        entries = GroupShard.objects.count()
+        with self.assertRaisesMessage(SnapshotError, 'A group named "Flat"'):
+            import_group(self.export())
+        self.assertEqual(GroupShard.objects.count(), entries)
+
+
+@skipUnless(settings.DATABASE_SHARDS > 1, "run with DATABASE_SHARDS=2")
+class ShardingTests(TestCase):
+    """Routing group data to shards and moving groups between them."""
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("alice", password="pw")
+        cls.superuser = User.objects.create_superuser("root", password="pw")
+        # New group ids alternate between the two shards
+        cls.groups = [Group.objects.create(name=name) for name in ("Flat", "Club")]
+        for group in cls.groups:
+            Membership(user=cls.admin, group=group, role="admin").save()
+
+    def shard_of(self, group):
+        return GroupShard.objects.shard_for(group.pk)
+
+    def test_group_data_is_routed_to_its_shard(self):
+        router = ShardRouter()
+        self.assertEqual(
+            {self.shard_of(group) for group in self.groups}, {"default", "shard_1"}
+        )
+        for group in self.groups:
+            alias = self.shard_of(group)
+            self.assertEqual(group._state.db, alias)
+            membership = Membership.objects.using(alias).get(group=group)
+            self.assertEqual(
+                router.db_for_write(Membership, instance=Membership(group=group)),
+                alias,
+            )
+            self.assertEqual(router.db_for_read(Membership, instance=group), alias)
+            self.assertEqual(
+                router.db_for_write(Membership, instance=membership), alias
+            )
+
+        self.assertEqual(router.db_for_read(User), "default")
+        self.assertEqual(router.db_for_read(Membership), "default")
+        with use_shard("shard_1"):
+            self.assertEqual(router.db_for_read(Membership), "shard_1")
+
+    def test_membership_is_created_in_group_shard(self):
+        user = User.objects.create_user("bob")
+        for group in self.groups:
+            Membership.objects.create(user=user, group=group)
+            self.assertTrue(
+                Membership.objects.using(self.shard_of(group))
+                .filter(user=user, group=group)
+                .exists()
+            )
+
+    def test_group_names_are_unique_across_shards(self):
+        for group in self.groups:
+            with self.assertRaises(ValidationError):
+                Group(name=group.name).validate_unique()
+        Group(name="Choir").validate_unique()
+
+    def test_user_memberships_span_shards(self):
+        memberships = _user_memberships(self.admin)
+        self.assertEqual(
+            [membership.group for membership in memberships],
+            list(reversed(self.groups)),
+        )
+
+    def test_move_group(self):
+        group = self.groups[0]
+        source = self.shard_of(group)
+        # More members than one batch of the joined_at updates
+        users = User.objects.bulk_create(
+            User(username=f"user{number}") for number in range(300)
+        )
+        joined_at = timezone.now() - timedelta(days=30)
+        Membership.objects.using(source).bulk_create(
+            Membership(
+                user=user, group=group, joined_at=joined_at - timedelta(hours=number)
+            )
+            for number, user in enumerate(users)
+        )
+        expected = dict(
+            Membership.objects.using(source)
+            .filter(group=group)
+            .values_list("user_id", "joined_at")
+        )
+
+        target = 1 - GroupShard.objects.get(pk=group.pk).shard
+        call_command("move_group", group.pk, target, stdout=StringIO())
+
+        entry = GroupShard.objects.get(pk=group.pk)
+        self.assertEqual((entry.alias, entry.is_locked), (self.shard_of(group), False))
+        self.assertNotEqual(entry.alias, source)
+        self.assertFalse(Group.objects.using(source).filter(pk=group.pk).exists())
+        self.assertEqual(
+            Group.objects.using(entry.alias).get(pk=group.pk).created_at,
+            group.created_at,
+        )
+        self.assertEqual(
+            dict(
+                Membership.objects.using(entry.alias)
+                .filter(group=group)
+                .values_list("user_id", "joined_at")
+            ),
+            expected,
+        )
+
+    def test_moving_group_is_refused(self):
+        group = self.groups[0]
+        GroupShard.objects.filter(pk=group.pk).update(is_locked=True)
+        target = 1 - GroupShard.objects.get(pk=group.pk).shard
+        with self.assertRaisesMessage(CommandError, "already being moved"):
+            call_command("move_group", group.pk, target)
+
+    def test_writes_to_moving_group_are_refused(self):
+        group = self.groups[1]
+        entry = GroupShard.objects.get(pk=group.pk)
+        GroupShard.objects.filter(pk=group.pk).update(is_locked=True)
+        memberships = Membership.objects.using(entry.alias).filter(group=group)
+        with self.assertRaises(GroupLocked):
+            apply_member_action(memberships, "adjust_points", self.admin, 5)
+
+        self.client.force_login(self.superuser)
+        response = self.client.post(
+            reverse("admin:users_membership_changelist") + f"?shard={entry.shard}",
+            {
+                "action": "adjust_points",
+                "_selected_action": [memberships.get().pk],
+                "points": "5",
+            },
+        )
+        self.assertEqual(memberships.get().points, 0)
+        self.assertEqual(
+            [str(message) for message in get_messages(response.wsgi_request)],
+            [GroupLocked().message],
+        )
@@ -23,6 +23,10 @@ from users.views import (
     DeleteGroupView,
     LeaveGroupView,
     InviteToGroupView,
+    ManageMembersView,
+    ActivityFeedView,
+    GroupActivityFeedView,
+    GroupEventsView,
 )
 from django.contrib.auth.views import LoginView, LogoutView
 
@@ -41,9 +45,25 @@ urlpatterns = [
         "groups/<int:group_id>/delete/", DeleteGroupView.as_view(), name="delete_group"
     ),
     path("groups/<int:group_id>/leave/", LeaveGroupView.as_view(), name="leave_group"),
+    path(
+        "groups/<int:group_id>/members/",
+        ManageMembersView.as_view(),
+        name="manage_members",
+    ),
     path(
         "groups/<int:group_id>/invite/",
         InviteToGroupView.as_view(),
         name="invite_to_group",
     ),
+    # Activity feed URLs
+    path("activity/", ActivityFeedView.as_view(), name="activity_feed"),
+    path(
+        "groups/<int:group_id>/activity/",
+        GroupActivityFeedView.as_view(),
+        name="group_activity_feed",
+    ),
+    # Live updates (Server-Sent Events, served through ASGI)
+    path(
+        "groups/<int:group_id>/events/", GroupEventsView.as_view(), name="group_events"
+    ),
 ]
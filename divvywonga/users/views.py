@@ -1,15 +1,58 @@
+import asyncio
+
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
-from django.db import transaction
-from django.db.models import Sum, Count, Q
-from django.http import HttpResponseRedirect, JsonResponse
-from django.urls import reverse
+from django.db import router, transaction
+from django.db.models import Sum
+from django.http import (
+    HttpResponse,
+    HttpResponseForbidden,
+    StreamingHttpResponse,
+)
 from django.core.exceptions import ValidationError
-from users.forms import UserRegisterForm, GroupCreateForm, GroupInviteForm
-from users.models import Group, Membership
+from django.core.handlers.asgi import ASGIRequest
+from core.pubsub import get_broker
+from users.activity import (
+    departure_activity,
+    group_channel,
+    make_activity,
+    paginate_feed,
+    record_activities,
+)
+from users.forms import (
+    UserRegisterForm,
+    GroupCreateForm,
+    GroupInviteForm,
+    BulkMembershipForm,
+)
+from users.members import ROLE_ACTIONS, apply_member_action, ensure_groups_have_admin
+from users.models import (
+    Activity,
+    Group,
+    GroupFeedEntry,
+    GroupLocked,
+    GroupPointsRollup,
+    GroupShard,
+    Membership,
+    UserFeedEntry,
+)
+from users.rollups import points_charts
+from users.sharding import shard_aliases, use_shard
+
+
+def _user_memberships(user):
+    """Collect the user's memberships from every shard."""
+    memberships = []
+    for alias in shard_aliases():
+        memberships.extend(
+            Membership.objects.using(alias).filter(user=user).select_related("group")
+        )
+    memberships.sort(key=lambda membership: membership.joined_at, reverse=True)
+    return memberships
 
 
 class RegisterView(View):
@@ -32,9 +75,7 @@ class CreateGroupView(LoginRequiredMixin, View):
 
     def get(self, request):
         form = GroupCreateForm(request=request)
-        user_groups = Membership.objects.filter(user=request.user).select_related(
-            "group"
-        )
+        user_groups = _user_memberships(request.user)
         return render(
             request,
             "users/create_group.html",
@@ -45,14 +86,24 @@ class CreateGroupView(LoginRequiredMixin, View):
         form = GroupCreateForm(request.POST, request=request)
 
         if form.is_valid():
-            with transaction.atomic():
+            # Reserve the group's id and shard, then create it there
+            shard = GroupShard.objects.allocate()
+            group = form.save(commit=False)
+            group.pk = shard.pk
+
+            with use_shard(shard.alias), transaction.atomic(using=shard.alias):
                 # Create the group
-                group = form.save()
+                group.save(force_insert=True)
 
                 # Automatically make the creator an admin member of the group
                 Membership.objects.create(
                     user=request.user, group=group, role="admin", points=0
                 )
+                activities = [
+                    make_activity(
+                        Activity.JOINED, group, request.user, request.user, role="admin"
+                    )
+                ]
 
                 # Process invited users by email
                 invite_emails = form.cleaned_data.get("invite_users", "")
@@ -79,11 +130,22 @@ class CreateGroupView(LoginRequiredMixin, View):
                                 Membership.objects.create(
                                     user=user, group=group, role=invite_role, points=0
                                 )
+                                activities.append(
+                                    make_activity(
+                                        Activity.INVITED,
+                                        group,
+                                        request.user,
+                                        user,
+                                        role=invite_role,
+                                    )
+                                )
 
                         except User.DoesNotExist:
                             # In a real app, you might want to send an invitation email here
                             pass  # Skip non-existent users for now
 
+                record_activities(activities)
+
                 # Prepare success message
                 message = (
                     f'Group "{group.name}" created successfully! You are now the admin.'
@@ -97,9 +159,7 @@ class CreateGroupView(LoginRequiredMixin, View):
                 )  # Redirect to the new group's detail page
 
         # If form is invalid, show the form again with errors
-        user_groups = Membership.objects.filter(user=request.user).select_related(
-            "group"
-        )
+        user_groups = _user_memberships(request.user)
         return render(
             request,
             "users/create_group.html",
@@ -114,8 +174,8 @@ class GroupDetailView(LoginRequiredMixin, View):
         # Get the group and ensure it exists
         group = get_object_or_404(Group, id=group_id)
 
-        # Get all members of the group
-        members = Membership.objects.filter(group=group).select_related("user")
+        # Get all members of the group (users are loaded from the default database)
+        members = Membership.objects.filter(group=group).prefetch_related("user")
 
         # Get the current user's membership (if they're a member)
         user_membership = members.filter(user=request.user).first()
@@ -137,6 +197,11 @@ class GroupDetailView(LoginRequiredMixin, View):
             "admin_count": admin_count,
             "moderator_count": moderator_count,
             "total_points": total_points,
+            "bulk_form": BulkMembershipForm(group=group),
+            "points_charts": points_charts(
+                GroupPointsRollup.objects.filter(group_id=group.id)
+            ),
+            "live_updates": live_updates_available(request),
         }
 
         return render(request, "users/group_detail.html", context)
@@ -157,7 +222,18 @@ class DeleteGroupView(LoginRequiredMixin, View):
 
         # Delete the group (this will cascade to memberships due to CASCADE in model)
         group_name = group.name
-        group.delete()
+        using = router.db_for_write(Membership)
+        try:
+            with transaction.atomic(using=using):
+                GroupShard.objects.ensure_unlocked(using, [group.id])
+                # Record first so the event still fans out to the group's members
+                record_activities(
+                    [make_activity(Activity.DELETED, group, request.user)]
+                )
+                group.delete()
+        except GroupLocked as e:
+            messages.error(request, e.message)
+            return redirect("group_detail", group_id=group.id)
 
         messages.success(
             request, f'Group "{group_name}" has been deleted successfully.'
@@ -178,24 +254,81 @@ class LeaveGroupView(LoginRequiredMixin, View):
             messages.error(request, "You are not a member of this group.")
             return redirect("index")
 
-        # Check if this is the last admin
-        if membership.role == "admin":
-            admin_count = Membership.objects.filter(group=group, role="admin").count()
-
-            if admin_count <= 1:
-                messages.error(
-                    request,
-                    "You are the last admin of this group. Please assign another admin before leaving.",
+        # Remove the membership, making sure a leaving admin isn't the last one
+        using = router.db_for_write(Membership)
+        try:
+            with transaction.atomic(using=using):
+                GroupShard.objects.ensure_unlocked(using, [group.id])
+                membership.delete()
+                if membership.role == "admin":
+                    ensure_groups_have_admin([group.id], using)
+                record_activities(
+                    [departure_activity(Activity.LEFT, membership, request.user)]
                 )
-                return redirect("group_detail", group_id=group.id)
-
-        # Remove the membership
-        membership.delete()
+        except GroupLocked as e:
+            messages.error(request, e.message)
+            return redirect("group_detail", group_id=group.id)
+        except ValidationError:
+            messages.error(
+                request,
+                "You are the last admin of this group. Please assign another admin before leaving.",
+            )
+            return redirect("group_detail", group_id=group.id)
 
         messages.success(request, f'You have left the group "{group.name}".')
         return redirect("index")
 
 
+class ManageMembersView(LoginRequiredMixin, View):
+    """View for applying an action to one or many group members at once."""
+
+    def post(self, request, group_id):
+        group = get_object_or_404(Group, id=group_id)
+
+        # Check if user has permission to manage members
+        membership = Membership.objects.filter(
+            user=request.user, group=group, role__in=["admin", "moderator"]
+        ).first()
+
+        if not membership and not request.user.is_superuser:
+            messages.error(
+                request, "You don't have permission to manage members of this group."
+            )
+            return redirect("group_detail", group_id=group.id)
+
+        form = BulkMembershipForm(request.POST, group=group)
+
+        if not form.is_valid():
+            for errors in form.errors.values():
+                messages.error(request, " ".join(errors))
+            return redirect("group_detail", group_id=group.id)
+
+        action = form.cleaned_data["action"]
+        memberships = form.cleaned_data["memberships"]
+
+        if not request.user.is_superuser and membership.role != "admin":
+            if action in ROLE_ACTIONS:
+                messages.error(request, "Only group admins can change member roles.")
+                return redirect("group_detail", group_id=group.id)
+
+            # Moderators can only manage regular members
+            memberships = memberships.filter(role="member")
+            if not memberships.exists():
+                messages.error(request, "Moderators can only manage regular members.")
+                return redirect("group_detail", group_id=group.id)
+
+        try:
+            count = apply_member_action(
+                memberships, action, request.user, form.cleaned_data["points"] or 0
+            )
+        except ValidationError as e:
+            messages.error(request, e.message)
+            return redirect("group_detail", group_id=group.id)
+
+        messages.success(request, f"Updated {count} member(s).")
+        return redirect("group_detail", group_id=group.id)
+
+
 class InviteToGroupView(LoginRequiredMixin, View):
     """View for inviting users to a group."""
 
@@ -241,12 +374,21 @@ class InviteToGroupView(LoginRequiredMixin, View):
                 if email.strip()
             ]
             invited_users = []
+            activities = []
 
-            for email in emails:
-                try:
-                    user = User.objects.get(email=email)
-                    # Check if user is already a member
-                    if not Membership.objects.filter(user=user, group=group).exists():
+            try:
+                using = router.db_for_write(Membership)
+                with transaction.atomic(using=using):
+                    GroupShard.objects.ensure_unlocked(using, [group.id])
+                    for email in emails:
+                        user = User.objects.filter(email=email).first()
+                        # In a real app, you might want to send an invitation
+                        # email to unknown addresses here
+                        if user is None:
+                            continue
+                        # Check if user is already a member
+                        if Membership.objects.filter(user=user, group=group).exists():
+                            continue
                         Membership.objects.create(
                             user=user,
                             group=group,
@@ -254,9 +396,20 @@ class InviteToGroupView(LoginRequiredMixin, View):
                             points=0,
                         )
                         invited_users.append(email)
-                except User.DoesNotExist:
-                    # In a real app, you might want to send an invitation email here
-                    pass
+                        activities.append(
+                            make_activity(
+                                Activity.INVITED,
+                                group,
+                                request.user,
+                                user,
+                                role=form.cleaned_data["role"],
+                            )
+                        )
+            except GroupLocked as e:
+                messages.error(request, e.message)
+                return redirect("group_detail", group_id=group.id)
+
+            record_activities(activities)
 
             if invited_users:
                 messages.success(
@@ -271,3 +424,109 @@ class InviteToGroupView(LoginRequiredMixin, View):
         return render(
             request, "users/invite_to_group.html", {"group": group, "form": form}
         )
+
+
+def _feed_cursor(request):
+    """Parse the `cursor` query parameter, ignoring anything that isn't an id."""
+    cursor = request.GET.get("cursor", "")
+    return int(cursor) if cursor.isdigit() else None
+
+
+class ActivityFeedView(LoginRequiredMixin, View):
+    """View for the activity feed across all of the user's groups."""
+
+    def get(self, request):
+        activities, next_cursor = paginate_feed(
+            UserFeedEntry.objects.filter(user=request.user), _feed_cursor(request)
+        )
+        return render(
+            request,
+            "users/activity_feed.html",
+            {"activities": activities, "next_cursor": next_cursor},
+        )
+
+
+class GroupActivityFeedView(LoginRequiredMixin, View):
+    """View for the activity feed of a single group."""
+
+    def get(self, request, group_id):
+        group = get_object_or_404(Group, id=group_id)
+
+        if (
+            not Membership.objects.filter(user=request.user, group=group).exists()
+            and not request.user.is_superuser
+        ):
+            messages.error(request, "You don't have permission to view this group.")
+            return redirect("index")
+
+        activities, next_cursor = paginate_feed(
+            GroupFeedEntry.objects.filter(group=group), _feed_cursor(request)
+        )
+        return render(
+            request,
+            "users/activity_feed.html",
+            {"group": group, "activities": activities, "next_cursor": next_cursor},
+        )
+
+
+def live_updates_available(request):
+    """
+    Whether the request is served by the ASGI application. Under WSGI the
+    event stream would be buffered and hold a worker for as long as it's open.
+    """
+    return isinstance(request, ASGIRequest)
+
+
+class GroupEventsView(View):
+    """
+    Server-Sent Events stream of membership changes for a group.
+
+    Served asynchronously through the ASGI application so an idle connection
+    only costs a pending queue read; a heartbeat comment is sent whenever no
+    event arrives within SSE_HEARTBEAT_INTERVAL seconds. Under WSGI it answers
+    204 No Content, which tells EventSource not to reconnect.
+    """
+
+    async def get(self, request, group_id):
+        if not live_updates_available(request):
+            return HttpResponse(status=204)
+
+        user = await request.auser()
+        if not user.is_authenticated:
+            return HttpResponseForbidden()
+
+        if (
+            not user.is_superuser
+            and not await Membership.objects.filter(
+                user=user, group_id=group_id
+            ).aexists()
+        ):
+            return HttpResponseForbidden()
+
+        subscription = get_broker().subscribe(group_channel(group_id))
+        response = StreamingHttpResponse(
+            self.stream(subscription), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # Stop reverse proxies from buffering the stream
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def stream(self, subscription):
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await subscription.get(settings.SSE_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+
+                if message is None:
+                    # The client fell too far behind; ask it to reload instead
+                    yield "event: resync\ndata: {}\n\n"
+                    break
+
+                yield f"data: {message}\n\n"
+        finally:
+            subscription.close()